@@ -1,12 +1,15 @@
 import streamlit as st
 import pandas as pd
-from io import StringIO
+import numpy as np
 import json
-import trimesh # type: ignore
 import plotly.graph_objects as go
 import os
-import math
-from modules.data_cleaning import nettoyer_donnees_brutes
+from modules.data_cleaning import nettoyer_donnees_brutes, nettoyer_fichier_excel, lire_donnees_collees
+from modules.stockage_mesures import enregistrer_mesures
+from modules.types_cotes import detecter_type, TYPES_COTES
+from modules.index_angulaire import completer_cotes_info
+from modules.maillage_3d import (charger_maillage, trace_maillage, animer_camera, ancrages_cotes,
+                                 regions_cotes, intensite_ecarts, NIVEAUX_DETAIL, NIVEAU_DEFAUT)
 
 st.set_page_config(page_title="Accueil - Étude dimensionnelle", layout="wide")
 st.title("🏭 Outil d'Étude Dimensionnelle")
@@ -35,31 +38,21 @@ elif type_analyse == "Comparaison (cire / métal, ScanBox / CMM, etc.)":
 else:
     st.warning("⚠️ Le type d’analyse sélectionné n’est pas encore pris en charge dans cette version.")
 
-# Fonctions 
-# Heuristique de type par défaut selon le nom
-def detect_type(nom):
-    nom_lower = nom.lower()
-    if "ø" in nom_lower or "diam" in nom_lower:
-        return "Diamètre extérieur"
-    elif "rayon" in nom_lower or "r" in nom_lower:
-        return "Rayon"
-    elif "épais" in nom_lower or "epaiss" in nom_lower:
-        return "Épaisseur"
-    elif "long" in nom_lower:
-        return "Longueur"
-    elif "angle" in nom_lower:
-        return "Angle"
-    elif "ales" in nom_lower:
-        return "Alésage"
-    else:
-        return "Autre"
-
 # --- LAYOUT ---
 
 st.subheader("📋 Coller les données CSV depuis Excel")
 text_input = st.text_area("📋 Collez ici les données brutes ou CSV formaté :", height=250)
+fichier_excel = st.file_uploader("📂 ... ou importez directement l'export Excel brut (.xlsx)", type="xlsx")
 
-if text_input.strip():
+df_long = None
+if fichier_excel is not None:
+    try:
+        df_long = nettoyer_fichier_excel(fichier_excel)
+        st.success("✅ Fichier Excel traité avec succès !")
+        st.dataframe(df_long)
+    except Exception as e:
+        st.error(f"❌ Erreur : {e}")
+elif text_input.strip():
     try:
         df_long = nettoyer_donnees_brutes(text_input)
         st.success("✅ Données traitées avec succès !")
@@ -67,6 +60,13 @@ if text_input.strip():
     except Exception as e:
         st.error(f"❌ Erreur : {e}")
 
+if df_long is not None and st.button("💾 Enregistrer dans l'historique des mesures"):
+    try:
+        n = enregistrer_mesures(df_long)
+        st.success(f"✅ {n} mesures enregistrées (partitionnées par OF et par mois).")
+    except Exception as e:
+        st.error(f"❌ Erreur lors de l'enregistrement : {e}")
+
 
 st.subheader("📐 Visualisation 3D des pièces")
 
@@ -116,38 +116,41 @@ with col2:
     chemin_fichier = os.path.join("static", fichier_stl) if fichier_stl else None
 
     if chemin_fichier and os.path.exists(chemin_fichier):
+        # Aperçu grossier par défaut, raffinement à la demande
+        niveau_detail = st.radio("Niveau de détail :", list(NIVEAUX_DETAIL), horizontal=True,
+                                 index=list(NIVEAUX_DETAIL).index(NIVEAU_DEFAUT))
         with st.spinner("🔄 Chargement du modèle 3D..."):
-            st.session_state.angle = st.session_state.get("angle", 0) + 5  # fait tourner
-            mesh = trimesh.load_mesh(chemin_fichier)
-
-            # Caméra
-            r = 2.5
-            theta = math.radians(st.session_state.angle)
-            camera_eye = dict(x=r * math.cos(theta), y=0.8, z=r * math.sin(theta))
-
-            fig = go.Figure(data=[
-                go.Mesh3d(
-                    x=mesh.vertices[:, 0],
-                    y=mesh.vertices[:, 1],
-                    z=mesh.vertices[:, 2],
-                    i=mesh.faces[:, 0],
-                    j=mesh.faces[:, 1],
-                    k=mesh.faces[:, 2],
-                    color='lightblue',
-                    opacity=1.0
-                )
-            ])
+            sommets, faces = charger_maillage(chemin_fichier, NIVEAUX_DETAIL[niveau_detail])
+
+            # Coloration par écart mesure - nominale (moyenne par cote pour l'OF choisi)
+            ecarts_sommets = None
+            if df_long is not None and st.checkbox("🌡️ Colorer par écart à la nominale"):
+                toutes_cotes = sorted(df_long["Nom_Cote"].dropna().astype(str).unique())
+                ofs = sorted(df_long["OF"].dropna().astype(str).unique())
+                of_choisi = st.selectbox("OF :", ["Tous"] + ofs, key="of_carte_3d")
+                d = df_long if of_choisi == "Tous" else df_long[df_long["OF"].astype(str) == of_choisi]
+                ecarts = (d["Mesure"] - d["Nominal"]).groupby(d["Nom_Cote"].astype(str)).mean().reindex(toutes_cotes)
+                ancrages = ancrages_cotes(sommets, toutes_cotes, st.session_state.get("cotes_info"))
+                ecarts_sommets = intensite_ecarts(regions_cotes(sommets, ancrages), ecarts.to_numpy())
+                sans_ancrage = [c for c, p in zip(toutes_cotes, ancrages) if np.isnan(p).any()]
+                if sans_ancrage:
+                    st.caption("📍 Cotes non placées sur le modèle (Point_3D, ou Angle_Degres et "
+                               "Hauteur_Relative, à renseigner) : " + ", ".join(sans_ancrage))
+
+            # Géométrie simplifiée et quantifiée (uint16) : charge utile réduite
+            fig = go.Figure(data=[trace_maillage(sommets, faces, ecarts_sommets, color='lightblue', opacity=1.0)])
 
             fig.update_layout(
                 scene=dict(
                     xaxis=dict(visible=False),
                     yaxis=dict(visible=False),
                     zaxis=dict(visible=False),
-                    camera=dict(eye=camera_eye),
                     aspectmode='data'
                 ),
                 margin=dict(l=0, r=0, t=0, b=0)
             )
+            # Rotation animée côté navigateur (caméra seule, maillage envoyé une fois)
+            animer_camera(fig)
 
             st.plotly_chart(fig, use_container_width=True)
 
@@ -158,17 +161,8 @@ with col2:
 
 if text_input:
     try:
-        df = pd.read_csv(StringIO(text_input), sep="\t")
-
-        # Vérification des colonnes attendues
-        expected_cols = ["Date", "Serial", "OF", "Nom_Cote", "Mesure", "Nominal", "Tolérance_Min", "Tolérance_Max"]
-        if not all(col in df.columns for col in expected_cols):
-            st.error(f"❌ Colonnes attendues : {expected_cols}. Colonnes détectées : {df.columns.tolist()}")
-        else:
-            st.success("✅ Données chargées avec succès !")
-
-            # Supprimer les doublons de Nom_Cote
-            unique_cotes = df["Nom_Cote"].dropna().unique()
+        df = lire_donnees_collees(text_input)
+        st.success("✅ Données chargées avec succès !")
 
         # --- Initialisation ---
         unique_cotes = df["Nom_Cote"].dropna().unique().tolist()
@@ -177,18 +171,27 @@ if text_input:
             st.session_state.cotes_info = {}
 
         # Ajouter les nouvelles cotes manquantes
+        a_indexer = [c for c in unique_cotes if "Position_Angulaire" not in st.session_state.cotes_info.get(c, {})]
         for cote in unique_cotes:
             if cote not in st.session_state.cotes_info:
                 st.session_state.cotes_info[cote] = {
-                    "Type_Cote": detect_type(cote),
+                    "Type_Cote": detecter_type(cote),
                     "Tolérances_GPS": [],
                     "Groupe_Profil": None
                 }
 
+        # Positions ANGx lues dans les noms : angle et groupe de profil pré-remplis
+        index_angles = completer_cotes_info(st.session_state.cotes_info, unique_cotes, a_indexer)
+        positions_par_base = (index_angles.dropna(subset=["Position_Angulaire"])
+                              .sort_values("Index_Angulaire")
+                              .groupby("Cote_Base", sort=False)["Position_Angulaire"].agg(list))
+        angle_par_position = dict(zip(zip(index_angles["Cote_Base"], index_angles["Position_Angulaire"]),
+                                      index_angles["Angle_Degres"]))
+
         if "groupes_cotes" not in st.session_state:
             st.session_state.groupes_cotes = []
 
-        types_possibles = ["Diamètre extérieur", "Alésage", "Épaisseur", "Rayon", "Longueur", "Angle", "Autre"]
+        types_possibles = TYPES_COTES
         gps_flat_list = [
             "Planéité", "Rectitude", "Circularité", "Cylindricité",
             "Parallélisme", "Perpendicularité", "Inclinaison",
@@ -224,18 +227,24 @@ if text_input:
                                 # Si c’est un rayon angulaire, proposer le choix de position angulaire
                                 if st.session_state.cotes_info[cote]["Type_Cote"] == "Rayon":
 
-                                    # Détection auto des ANGx présents dans le jeu de données
-                                    all_cotes = df["Nom_Cote"].dropna().unique().tolist()
-                                    ang_candidats = sorted({c.split()[-1] for c in all_cotes if "ANG" in c and cote.replace(" ANG", "") in c})
-                                    ang_options = [f"ANG{i}" for i in range(1, len(ang_candidats)+1)] if ang_candidats else []
+                                    # Positions ANGx de la même cote de base (index calculé une fois)
+                                    base = index_angles["Cote_Base"].get(cote)
+                                    ang_options = positions_par_base.get(base, [])
                                     position_choices = ["Non spécifié"] + ang_options + ["Autre (angle personnalisé)"]
+                                    position_actuelle = st.session_state.cotes_info[cote]["Position_Angulaire"]
 
-                                    choix_angulaire = st.selectbox("Position angulaire", position_choices, key=f"angulaire_{cote}")
+                                    choix_angulaire = st.selectbox(
+                                        "Position angulaire", position_choices,
+                                        index=position_choices.index(position_actuelle) if position_actuelle in position_choices else 0,
+                                        key=f"angulaire_{cote}"
+                                    )
                                     st.session_state.cotes_info[cote]["Position_Angulaire"] = choix_angulaire
 
                                     if choix_angulaire == "Autre (angle personnalisé)":
                                         angle_libre = st.number_input("Angle (en degrés)", min_value=0.0, max_value=360.0, step=1.0, key=f"angle_libre_{cote}")
                                         st.session_state.cotes_info[cote]["Angle_Degres"] = angle_libre
+                                    elif choix_angulaire in ang_options:
+                                        st.session_state.cotes_info[cote]["Angle_Degres"] = float(angle_par_position[(base, choix_angulaire)])
                                     else:
                                         st.session_state.cotes_info[cote]["Angle_Degres"] = None
 
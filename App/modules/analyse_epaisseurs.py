@@ -132,6 +132,63 @@ import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
 
+from modules.champ_epaisseurs import matrice_epaisseurs, enveloppes, grille_reguliere
+
+# --- Positions de palpage ---
+# Priorité aux positions réelles : colonne Position des données, puis
+# cotes_info[cote]["Positions"] (liste en mm : points palpés sur une pièce,
+# dans l'ordre de mesure) ou cotes_info[cote]["Position"] (un seul point,
+# appliqué à toutes les mesures de la cote). À défaut, les mesures de chaque
+# cote sont réparties sur 0-100 mm dans l'ordre des lignes ; une liste plus
+# courte que le nombre de points par pièce laisse ces points par défaut.
+def _positions_palpage(df, cotes_info=None, longueur=100.0):
+    # (positions, masque des positions attribuées par défaut)
+    cotes_info = cotes_info or {}
+    code, noms = pd.factorize(df["Nom_Cote"])
+    groupes = df.groupby(code, sort=False)
+    rang = groupes.cumcount().to_numpy()
+    taille = groupes["Nom_Cote"].transform("size").to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        position = np.where(taille > 1, longueur * rang / (taille - 1), 0.0)
+
+    # Liste déclarée : tableau [cote, rang du point sur la pièce], rang compté par pièce
+    rang_piece = df.groupby([code, df["Serial"]], sort=False, dropna=False).cumcount().to_numpy() \
+        if "Serial" in df.columns else rang
+    listes = [cotes_info.get(nom, {}).get("Positions") or [] for nom in noms]
+    largeur = max([len(l) for l in listes] + [1])
+    declarees = np.full((len(noms) + 1, largeur), np.nan)
+    for i, liste in enumerate(listes):
+        declarees[i, :len(liste)] = liste
+    declaree = declarees[code, np.minimum(rang_piece, largeur - 1)]
+    declaree[rang_piece >= largeur] = np.nan
+
+    # Position unique déclarée : toutes les mesures de la cote
+    unique = np.array([np.nan if cotes_info.get(nom, {}).get("Position") is None else cotes_info[nom]["Position"]
+                       for nom in noms] + [np.nan], dtype=float)
+    declaree = np.where(np.isnan(declaree), unique[code], declaree)
+    if "Position" in df.columns:
+        declaree = np.where(df["Position"].isna().to_numpy(), declaree, df["Position"].to_numpy(dtype=float))
+    par_defaut = np.isnan(declaree)
+    return np.where(par_defaut, position, declaree), par_defaut
+
+
+def attribuer_positions(df, cotes_info=None, longueur=100.0):
+    position, _ = _positions_palpage(df, cotes_info, longueur)
+    return df.assign(Position=position)
+
+
+def positions_reelles(df, cotes_info=None):
+    # Vrai si aucune position ne vient de la répartition par défaut
+    return not _positions_palpage(df, cotes_info)[1].any()
+
+
+def cotes_positions_incompletes(df, cotes_info=None):
+    # Cotes dont une partie seulement des points a une position connue
+    _, par_defaut = _positions_palpage(df, cotes_info)
+    part = pd.Series(par_defaut).groupby(df["Nom_Cote"].to_numpy(), sort=True).mean()
+    return part[(part > 0) & (part < 1)].index.tolist()
+
+
 def analyser_epaisseurs(df):
     # Validation des colonnes nécessaires
     required_cols = ["Nom_Cote", "Mesure", "Nominal", "Tolérance_Min", "Tolérance_Max"]
@@ -139,23 +196,34 @@ def analyser_epaisseurs(df):
         st.warning("❗ Les colonnes nécessaires pour l'analyse d'épaisseur sont manquantes.")
         return
 
-    # Vérifie s'il y a une colonne Position, sinon générer une par défaut
-    if "Position" not in df.columns:
-        unique_cotes = df["Nom_Cote"].unique()
-        position_mapping = {
-            cote: list(np.linspace(0, 100, len(df[df["Nom_Cote"] == cote])))
-            for cote in unique_cotes
-        }
-        df["Position"] = df.apply(lambda row: position_mapping[row["Nom_Cote"]].pop(0), axis=1)
-
-    df["Écart"] = df["Mesure"] - df["Nominal"]
-    df["Hors_Tol"] = (df["Mesure"] < df["Tolérance_Min"]) | (df["Mesure"] > df["Tolérance_Max"])
+    # Positions réelles si connues, sinon réparties par défaut
+    cotes_info = st.session_state.get("cotes_info")
+    palpage = positions_reelles(df, cotes_info)
+    incompletes = cotes_positions_incompletes(df, cotes_info)
+    if incompletes:
+        st.warning("⚠️ Positions déclarées en nombre inférieur aux points palpés par pièce, "
+                   "les points restants sont répartis par défaut : " + ", ".join(map(str, incompletes)))
+    if "Position" not in df.columns or df["Position"].isna().any():
+        df = attribuer_positions(df, cotes_info)
+
+    df = df.assign(
+        Écart=df["Mesure"] - df["Nominal"],
+        Hors_Tol=(df["Mesure"] < df["Tolérance_Min"]) | (df["Mesure"] > df["Tolérance_Max"]),
+    )
 
     st.subheader("🧱 Analyse avancée des épaisseurs")
 
     selected_cote = st.selectbox("Sélectionnez une cote :", df["Nom_Cote"].unique())
     df_cote = df[df["Nom_Cote"] == selected_cote]
 
+    vues = ["🏭 Flotte (toutes pièces)", "📈 Mesures brutes"]
+    # Vue flotte par défaut seulement si plusieurs pièces sont palpées à des positions connues
+    multi_pieces = "Serial" in df.columns and df_cote["Serial"].nunique() > 1
+    vue = st.radio("Vue :", vues, index=0 if multi_pieces and palpage else 1, horizontal=True, key="vue_epaisseurs")
+    if vue == vues[0]:
+        afficher_champ_epaisseurs(df, df_cote, selected_cote)
+        return
+
     col1, col2 = st.columns([2, 1])
 
     with col1:
@@ -230,3 +298,85 @@ def analyser_epaisseurs(df):
                 df_cote[["Position", "Mesure", "Nominal", "Écart", "Tolérance_Min", "Tolérance_Max", "Hors_Tol"]],
                 use_container_width=True
             )
+
+
+# --- Vue flotte : enveloppes par position et carte pièces x position ---
+def afficher_champ_epaisseurs(df, df_cote, selected_cote):
+    matrice = matrice_epaisseurs(df_cote)
+    env = enveloppes(matrice)
+    if env.empty:
+        st.info("Aucune mesure exploitable pour cette cote.")
+        return
+    x = env["Position"]
+
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        fig = go.Figure()
+        bandes = [
+            ("Tolérance_Max", "Tolérance_Min", "rgba(0,200,0,0.1)", "Zone tolérée"),
+            ("Max", "Min", "rgba(100,100,100,0.15)", "Min / Max pièces"),
+        ]
+        for haut, bas, couleur, nom in bandes:
+            fig.add_trace(go.Scatter(x=x, y=env[haut], mode="lines", line=dict(width=0), showlegend=False, hoverinfo="skip"))
+            fig.add_trace(go.Scatter(x=x, y=env[bas], mode="lines", line=dict(width=0), fill="tonexty",
+                                     fillcolor=couleur, name=nom))
+        for signe, nom in [(1, "Moyenne + 3σ"), (-1, "Moyenne - 3σ")]:
+            fig.add_trace(go.Scatter(x=x, y=env["Moyenne"] + signe * 3 * env["Écart-type"], mode="lines",
+                                     line=dict(color="orange", dash="dash"), name=nom))
+        fig.add_trace(go.Scatter(x=x, y=env["Moyenne"], mode="lines+markers", line=dict(color="blue"), name="Moyenne"))
+        fig.update_layout(
+            title=f"📈 Enveloppe d'épaisseur : {selected_cote} ({len(matrice['pieces'])} pièces)",
+            xaxis_title="Position (mm)",
+            yaxis_title="Mesure (mm)",
+            height=500
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    with col2:
+        tab1, tab2 = st.tabs(["📊 Cpk par position", "📋 Enveloppes"])
+        with tab1:
+            cpk = env["Cpk"]
+            fig_cpk = go.Figure(go.Bar(
+                x=x, y=cpk,
+                marker_color=np.where(cpk < 1.33, "red", "green"),
+            ))
+            fig_cpk.add_hline(y=1.33, line_dash="dash", line_color="gray")
+            fig_cpk.update_layout(title="Cpk par position", xaxis_title="Position (mm)", height=350)
+            st.plotly_chart(fig_cpk, use_container_width=True)
+        with tab2:
+            st.dataframe(env.round(4), use_container_width=True)
+
+    # Carte de chaleur : écart à la nominale interpolé sur une grille régulière
+    ecarts = matrice["mesures"] - matrice["nominal"]
+    grille, carte = grille_reguliere(matrice, valeurs=ecarts)
+    limite = np.nanmax(np.abs(carte)) if np.isfinite(carte).any() else 1.0
+    fig_carte = go.Figure(go.Heatmap(
+        x=grille, y=matrice["pieces"], z=carte,
+        colorscale="RdBu_r", zmid=0, zmin=-limite, zmax=limite,
+        colorbar=dict(title="Écart (mm)"),
+    ))
+    fig_carte.update_layout(
+        title="🌡️ Écart à la nominale par pièce et position",
+        xaxis_title="Position (mm)",
+        yaxis_title="Pièce",
+        height=max(400, min(900, 12 * len(matrice["pieces"]))),
+    )
+    st.plotly_chart(fig_carte, use_container_width=True)
+
+    # Synthèse toutes cotes : position la plus critique de chaque cote
+    with st.expander("📋 Synthèse de toutes les cotes d'épaisseur"):
+        lignes = []
+        for nom, d in df.groupby("Nom_Cote", sort=True, observed=True):
+            e = enveloppes(matrice_epaisseurs(d))
+            if e.empty:
+                continue
+            pire = e.loc[e["Cpk"].fillna(np.inf).idxmin()]
+            lignes.append({
+                "Nom_Cote": nom,
+                "N Positions": len(e),
+                "N Pièces max": int(e["N"].max()),
+                "Position critique": pire["Position"],
+                "Cpk min": pire["Cpk"],
+                "% Hors Tol max": e["% Hors Tol"].max(),
+            })
+        st.dataframe(pd.DataFrame(lignes).round(3), use_container_width=True)
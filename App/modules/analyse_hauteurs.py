@@ -2,6 +2,96 @@ import streamlit as st
 import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
+from modules.sous_echantillonnage import sous_echantillonner, masque_hors_tolerance
+
+SEUIL_WEBGL = 20
+N_GROUPES_COULEUR = 10
+PALETTE = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd",
+           "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf"]
+
+
+def _avec_separateurs(valeurs, ruptures):
+    # Insère un NaN (ou NaT) à chaque changement de cote pour couper la ligne
+    valeurs = np.asarray(valeurs)
+    if np.issubdtype(valeurs.dtype, np.datetime64):
+        vide = np.datetime64("NaT")
+    elif np.issubdtype(valeurs.dtype, np.number):
+        valeurs = valeurs.astype(float)
+        vide = np.nan
+    else:
+        valeurs = valeurs.astype(object)
+        vide = None
+    return np.insert(valeurs, ruptures, vide)
+
+
+def _figures_webgl(df_filtered, selected_cotes, colonne_x):
+    # Cotes réparties en N_GROUPES_COULEUR groupes : une trace Scattergl par groupe
+    # (légende cliquable par groupe, nom de la cote dans le survol), une seule
+    # trace pour toutes les bandes de tolérance et une trace Bar par groupe.
+    # Seules les courbes sont réduites ; les barres d'écart restent complètes.
+    if not len(selected_cotes) or df_filtered.empty:
+        # Aucune cote : graphiques vides, comme en rendu SVG
+        return go.Figure(), go.Figure()
+    ordre_cotes = {cote: i for i, cote in enumerate(selected_cotes)}
+    d = df_filtered.assign(_rang=df_filtered["Nom_Cote"].map(ordre_cotes).astype(int))
+    d = d.sort_values(["_rang", colonne_x], kind="stable")
+    d["_groupe"] = d["_rang"] % N_GROUPES_COULEUR
+    # Écarts : toutes les barres, comme en rendu SVG (pas de réduction)
+    complet = d
+    # Réduction côté serveur des longues séries, cote par cote (hors tolérance conservés)
+    d = pd.concat([sous_echantillonner(d_c, colonne_x, "Mesure", garder=masque_hors_tolerance(d_c))
+                   for _, d_c in d.groupby("_rang", sort=True)])
+
+    fig = go.Figure()
+    fig_bar = go.Figure()
+    barres = dict(tuple(complet.groupby("_groupe", sort=True)))
+    for groupe, d_g in d.groupby("_groupe", sort=True):
+        rang = d_g["_rang"].to_numpy()
+        ruptures = np.flatnonzero(rang[1:] != rang[:-1]) + 1
+        cotes_groupe = [selected_cotes[r] for r in np.unique(rang)]
+        nom = f"Groupe {groupe + 1} : " + ", ".join(map(str, cotes_groupe[:3])) + (" …" if len(cotes_groupe) > 3 else "")
+        couleur = PALETTE[groupe % len(PALETTE)]
+        texte = d_g["Nom_Cote"].astype(str).to_numpy()
+
+        fig.add_trace(go.Scattergl(
+            x=_avec_separateurs(d_g[colonne_x], ruptures),
+            y=_avec_separateurs(d_g["Mesure"], ruptures),
+            hovertext=_avec_separateurs(texte, ruptures),
+            hovertemplate="%{hovertext}<br>%{x}<br>Mesure : %{y:.3f}<extra></extra>",
+            mode='lines+markers',
+            name=nom,
+            legendgroup=f"g{groupe}",
+            line=dict(color=couleur),
+            marker=dict(color=couleur, size=5)
+        ))
+        b_g = barres[groupe]
+        fig_bar.add_trace(go.Bar(
+            x=b_g[colonne_x],
+            y=b_g["Écart"],
+            hovertext=b_g["Nom_Cote"].astype(str).to_numpy(),
+            hovertemplate="%{hovertext}<br>%{x}<br>Écart : %{y:.3f}<extra></extra>",
+            name=nom,
+            legendgroup=f"g{groupe}",
+            marker_color=couleur
+        ))
+
+    rang = d["_rang"].to_numpy()
+    ruptures = np.flatnonzero(rang[1:] != rang[:-1]) + 1
+    x_tol = _avec_separateurs(d[colonne_x], ruptures)
+    for colonne, nom in [("Tolérance_Min", "Tolérances"), ("Tolérance_Max", "Tolérances")]:
+        fig.add_trace(go.Scattergl(
+            x=x_tol,
+            y=_avec_separateurs(d[colonne], ruptures),
+            hovertext=_avec_separateurs(d["Nom_Cote"].astype(str).to_numpy(), ruptures),
+            hovertemplate="%{hovertext}<br>" + colonne + " : %{y:.3f}<extra></extra>",
+            mode='lines',
+            name=nom,
+            legendgroup="tolerances",
+            showlegend=colonne == "Tolérance_Min",
+            line=dict(color="gray", dash='dot', width=1)
+        ))
+    return fig, fig_bar
+
 
 def analyser_hauteurs(df):
     st.subheader("📊 Analyse dimensionnelle par hauteur")
@@ -33,36 +123,57 @@ def analyser_hauteurs(df):
     # Calcul des écarts
     df_filtered["Écart"] = df_filtered["Mesure"] - df_filtered["Nominal"]
 
-    # GRAPHIQUE MULTI-CURVE
-    fig = go.Figure()
+    # Rendu : une trace SVG par cote, ou WebGL avec toutes les cotes regroupées
+    # dans quelques traces (séparateurs NaN) au-delà de SEUIL_WEBGL cotes
+    rendu = st.radio("Rendu :", ["Auto", "SVG (une trace par cote)", "WebGL regroupé"], horizontal=True)
+    webgl = rendu == "WebGL regroupé" or (rendu == "Auto" and len(selected_cotes) > SEUIL_WEBGL)
 
-    for cote in selected_cotes:
-        df_cote = df_filtered[df_filtered["Nom_Cote"] == cote]
+    if webgl:
+        fig, fig_bar = _figures_webgl(df_filtered, selected_cotes, colonne_x)
+    else:
+        # GRAPHIQUE MULTI-CURVE
+        fig = go.Figure()
 
-        fig.add_trace(go.Scatter(
-            x=df_cote[colonne_x],
-            y=df_cote["Mesure"],
-            mode='lines+markers',
-            name=cote
-        ))
+        for cote in selected_cotes:
+            df_cote = df_filtered[df_filtered["Nom_Cote"] == cote]
+            # Réduction côté serveur des longues séries (hors tolérance conservés)
+            df_cote = sous_echantillonner(df_cote, colonne_x, "Mesure", garder=masque_hors_tolerance(df_cote))
 
-        fig.add_trace(go.Scatter(
-            x=df_cote[colonne_x],
-            y=df_cote["Tolérance_Min"],
-            mode='lines',
-            name=f"{cote} - Tolérance min",
-            line=dict(dash='dot'),
-            showlegend=False
-        ))
+            fig.add_trace(go.Scatter(
+                x=df_cote[colonne_x],
+                y=df_cote["Mesure"],
+                mode='lines+markers',
+                name=cote
+            ))
 
-        fig.add_trace(go.Scatter(
-            x=df_cote[colonne_x],
-            y=df_cote["Tolérance_Max"],
-            mode='lines',
-            name=f"{cote} - Tolérance max",
-            line=dict(dash='dot'),
-            showlegend=False
-        ))
+            fig.add_trace(go.Scatter(
+                x=df_cote[colonne_x],
+                y=df_cote["Tolérance_Min"],
+                mode='lines',
+                name=f"{cote} - Tolérance min",
+                line=dict(dash='dot'),
+                showlegend=False
+            ))
+
+            fig.add_trace(go.Scatter(
+                x=df_cote[colonne_x],
+                y=df_cote["Tolérance_Max"],
+                mode='lines',
+                name=f"{cote} - Tolérance max",
+                line=dict(dash='dot'),
+                showlegend=False
+            ))
+
+        # BAR CHART : ÉCARTS
+        fig_bar = go.Figure()
+
+        for cote in selected_cotes:
+            df_cote = df_filtered[df_filtered["Nom_Cote"] == cote]
+            fig_bar.add_trace(go.Bar(
+                x=df_cote[colonne_x],
+                y=df_cote["Écart"],
+                name=cote
+            ))
 
     fig.update_layout(
         title="📈 Mesures en fonction de la hauteur",
@@ -71,17 +182,6 @@ def analyser_hauteurs(df):
         height=500
     )
 
-    # BAR CHART : ÉCARTS
-    fig_bar = go.Figure()
-
-    for cote in selected_cotes:
-        df_cote = df_filtered[df_filtered["Nom_Cote"] == cote]
-        fig_bar.add_trace(go.Bar(
-            x=df_cote[colonne_x],
-            y=df_cote["Écart"],
-            name=cote
-        ))
-
     fig_bar.update_layout(
         title="📊 Écarts par rapport au nominal",
         xaxis_title=colonne_x,
@@ -185,7 +185,51 @@
 #         st.plotly_chart(fig, use_container_width=True, key=f"radar_{i}")
 import streamlit as st
 import plotly.graph_objects as go
-from collections import defaultdict
+import numpy as np
+import pandas as pd
+from modules.forme_geometrique import ecarts_de_forme, synthese_forme
+
+
+# --- Matrice dense cote x angle x pièce ---
+# Les mesures angulaires sont pivotées une seule fois : chaque vue (coupe à un
+# angle, écarts, radars) n'est ensuite qu'une tranche de la matrice.
+def matrice_rayons(df_rayon: pd.DataFrame) -> dict:
+    d = df_rayon.dropna(subset=["Angle_Degres", "Mesure"])
+    i_cote, noms = pd.factorize(d["Nom_Cote"], sort=False)
+    angles = d["Angle_Degres"].to_numpy(dtype=float)
+    angles_uniques = np.unique(angles)
+    i_angle = np.searchsorted(angles_uniques, angles)
+    pieces = d["Serial"] if "Serial" in d.columns else pd.Series(0, index=d.index)
+    i_piece, pieces_uniques = pd.factorize(pieces, sort=True)
+
+    mesures = np.full((len(noms), len(angles_uniques), len(pieces_uniques)), np.nan)
+    mesures[i_cote, i_angle, i_piece] = d["Mesure"].to_numpy(dtype=float)
+
+    # Attributs par cote (première occurrence), dans l'ordre des indices de cote
+    colonnes = [c for c in ["Nominal", "Tolérance_Min", "Tolérance_Max", "Hauteur"] if c in d.columns]
+    premiers = d[colonnes].groupby(i_cote, sort=True).first()
+    hauteur = premiers["Hauteur"].to_numpy(dtype=float) if "Hauteur" in premiers.columns else np.zeros(len(noms))
+    return {
+        "noms": np.asarray(noms, dtype=object),
+        "angles": angles_uniques,
+        "pieces": np.asarray(pieces_uniques, dtype=object),
+        "mesures": mesures,
+        "nominal": premiers["Nominal"].to_numpy(dtype=float),
+        "tol_min": premiers["Tolérance_Min"].to_numpy(dtype=float),
+        "tol_max": premiers["Tolérance_Max"].to_numpy(dtype=float),
+        "hauteur": np.nan_to_num(hauteur),
+    }
+
+
+def _vue_pieces(matrice: dict, piece=None) -> np.ndarray:
+    # Matrice cote x angle pour une pièce, ou moyenne des pièces
+    if piece is None:
+        with np.errstate(invalid="ignore"):
+            m = matrice["mesures"]
+            n = np.sum(~np.isnan(m), axis=2)
+            return np.where(n > 0, np.nansum(m, axis=2) / np.maximum(n, 1), np.nan)
+    return matrice["mesures"][:, :, np.flatnonzero(matrice["pieces"].astype(str) == str(piece))[0]]
+
 
 def analyser_rayons(df_rayon):
     if df_rayon.empty or "Angle_Degres" not in df_rayon.columns:
@@ -198,93 +242,59 @@ def analyser_rayons(df_rayon):
         of_selectionne = st.selectbox("📦 Choisissez un OF :", of_dispo)
         df_rayon = df_rayon[df_rayon["OF"] == of_selectionne]
 
-    angles = sorted(df_rayon["Angle_Degres"].dropna().unique().tolist())
-    noms_cotes = df_rayon["Nom_Cote"].unique().tolist()
-
-    cotes = {}
-    hauteurs = {}
-    groupes_disponibles = defaultdict(list)
-
-    for nom in noms_cotes:
-        df_cote = df_rayon[df_rayon["Nom_Cote"] == nom].dropna(subset=["Angle_Degres", "Mesure"])
-        if df_cote.empty:
-            continue
-        mesures_dict = dict(zip(df_cote["Angle_Degres"], df_cote["Mesure"]))
-        mesures = [mesures_dict.get(angle, None) for angle in angles]
-        if all(m is None for m in mesures):
-            continue
-
-        infos = st.session_state.cotes_info.get(nom, {})
-        groupe = infos.get("Groupe_Profil", "Sans groupe")
-        groupes_disponibles[groupe].append(nom)
-
-        nominal = df_cote["Nominal"].iloc[0]
-        tol_min = df_cote["Tolérance_Min"].iloc[0]
-        tol_max = df_cote["Tolérance_Max"].iloc[0]
-        hauteur = df_cote["Hauteur"].iloc[0] if "Hauteur" in df_cote.columns else 0
-
-        cotes[nom] = dict(
-            base=nominal,
-            tol_plus=tol_max,
-            tol_moins=tol_min,
-            mesures=mesures
-        )
-        hauteurs[nom] = hauteur
-
-    if not cotes:
+    matrice = matrice_rayons(df_rayon)
+    if matrice["mesures"].size == 0:
         st.info("Aucune cote angulaire exploitable.")
         return
 
+    # --- Pièce affichée (moyenne par défaut si plusieurs pièces)
+    piece = None
+    if len(matrice["pieces"]) > 1:
+        choix = st.selectbox("🔩 Pièce :", ["Moyenne des pièces"] + matrice["pieces"].astype(str).tolist())
+        piece = None if choix == "Moyenne des pièces" else choix
+    vue = _vue_pieces(matrice, piece)
+
+    noms, angles, hauteurs = matrice["noms"], matrice["angles"], matrice["hauteur"]
+    tol_min, tol_max, nominal = matrice["tol_min"], matrice["tol_max"], matrice["nominal"]
+
     # --- Choix de l’angle pour la vue verticale et bar chart
-    angle_selectionne = st.selectbox("📐 Choisissez un angle pour la vue verticale :", angles)
-    idx = angles.index(angle_selectionne)
+    angle_selectionne = st.selectbox("📐 Choisissez un angle pour la vue verticale :", angles.tolist())
+    colonne = vue[:, int(np.searchsorted(angles, angle_selectionne))]
+    presentes = ~np.isnan(colonne)
 
     # --- Affichage Coupe verticale
     fig_section = go.Figure()
-    x_points, y_points = [], []
-
-    for nom, val in cotes.items():
-        y = hauteurs[nom]
-        x = val["mesures"][idx]
-        if x is None:
-            continue
-        x_points.append(x)
-        y_points.append(y)
-        fig_section.add_trace(go.Scatter(
-            x=[x], y=[y], mode='markers+text',
-            text=[nom], textposition="middle right",
-            marker=dict(size=10), name=nom
-        ))
-        fig_section.add_shape(type="line", x0=val["tol_moins"], x1=val["tol_plus"], y0=y, y1=y,
-                              line=dict(color="gray", dash="dot"))
-
     fig_section.add_trace(go.Scatter(
-        x=x_points, y=y_points, mode='lines', name='Liaison verticale',
+        x=colonne[presentes], y=hauteurs[presentes], mode='markers+text',
+        text=noms[presentes], textposition="middle right",
+        marker=dict(size=10), name="Mesures"
+    ))
+    # Segments de tolérance : une seule trace, séparés par des NaN
+    x_tol = np.column_stack([tol_min, tol_max, np.full(len(noms), np.nan)])[presentes].ravel()
+    y_tol = np.column_stack([hauteurs, hauteurs, np.full(len(noms), np.nan)])[presentes].ravel()
+    fig_section.add_trace(go.Scatter(
+        x=x_tol, y=y_tol, mode='lines', name='Tolérances',
+        line=dict(color="gray", dash="dot"), hoverinfo="skip"
+    ))
+    fig_section.add_trace(go.Scatter(
+        x=colonne[presentes], y=hauteurs[presentes], mode='lines', name='Liaison verticale',
         line=dict(color='lightgreen', width=2)
     ))
     fig_section.update_layout(
         title=f"🧩 Coupe verticale à {angle_selectionne}°",
         xaxis_title="Mesure (mm)", yaxis_title="Hauteur",
-        yaxis=dict(range=[min(hauteurs.values()) - 10, max(hauteurs.values()) + 10]),
+        yaxis=dict(range=[hauteurs.min() - 10, hauteurs.max() + 10]),
         height=500
     )
 
     # --- Graphe des écarts
-    noms, deviations, couleurs = [], [], []
-    for nom, val in cotes.items():
-        mesure = val["mesures"][idx]
-        if mesure is None:
-            continue
-        nominal = val["base"]
-        noms.append(nom)
-        deviations.append(mesure - nominal)
-        couleurs.append("red" if mesure < val["tol_moins"] or mesure > val["tol_plus"] else "lightgreen")
-
+    deviations = (colonne - nominal)[presentes]
+    hors_tol = ((colonne < tol_min) | (colonne > tol_max))[presentes]
     fig_bar = go.Figure()
     fig_bar.add_trace(go.Bar(
-        x=noms, y=deviations,
+        x=noms[presentes], y=deviations,
         text=[f"{dev:+.3f} mm" for dev in deviations],
-        textposition="outside", marker_color=couleurs
+        textposition="outside", marker_color=np.where(hors_tol, "red", "lightgreen")
     ))
     fig_bar.update_layout(
         title=f"📊 Écart par rapport au nominal à {angle_selectionne}°",
@@ -302,71 +312,57 @@ def analyser_rayons(df_rayon):
     with col2:
         st.markdown("### 📡 Radar de profils angulaires (par groupe)")
 
-        groupes_valides = {
-            g: noms for g, noms in groupes_disponibles.items()
-            if len(noms) >= 3 and all(c in cotes for c in noms)
+        # Profils : groupes de cotes (une cote par angle, Groupe_Profil) et
+        # cotes mesurées elles-mêmes sur au moins 3 angles.
+        # Chaque profil est une liste de couples (indice de cote, indice d'angle).
+        infos = st.session_state.get("cotes_info", {})
+        index_angle = {a: i for i, a in enumerate(angles)}
+        profils = {}
+        for k, nom in enumerate(noms):
+            info = infos.get(nom, {})
+            angle = info.get("Angle_Degres")
+            if angle is not None and float(angle) in index_angle:
+                groupe = info.get("Groupe_Profil") or "Sans groupe"
+                profils.setdefault(groupe, []).append((k, index_angle[float(angle)]))
+        for k in np.flatnonzero(np.sum(~np.isnan(vue), axis=1) >= 3):
+            profils[f"Cote : {noms[k]}"] = [(k, a) for a in np.flatnonzero(~np.isnan(vue[k]))]
+
+        profils_valides = {
+            g: np.array(points) for g, points in profils.items()
+            if len(points) >= 3 and not np.isnan(vue[tuple(np.array(points).T)]).any()
         }
 
-        if not groupes_valides:
+        if not profils_valides:
             st.info("Aucun groupe avec au moins 3 cotes valides pour tracer un radar.")
-            return
 
         groupes_selectionnes = st.multiselect(
             "🧭 Sélectionnez un ou plusieurs groupes à afficher :",
-            options=list(groupes_valides.keys()),
-            default=list(groupes_valides.keys())[:3]
-        )
+            options=list(profils_valides.keys()),
+            default=list(profils_valides.keys())[:3]
+        ) if profils_valides else []
 
         for groupe in groupes_selectionnes:
-            noms = groupes_valides[groupe]
-            noms = sorted(noms, key=lambda n: st.session_state.cotes_info.get(n, {}).get("Angle_Degres", 0))
-
-            r_values = []
-            theta_values = []
-
-            for nom in noms:
-                angle = st.session_state.cotes_info[nom].get("Angle_Degres", None)
-                mesure_idx = angles.index(angle) if angle in angles else None
-                val = cotes.get(nom)
-                if val and mesure_idx is not None:
-                    r_values.append(val["mesures"][mesure_idx])
-                    theta_values.append(angle)
-
-            if len(r_values) < 3:
-                continue
-
-            r_values += [r_values[0]]
-            theta_values += [theta_values[0]]
-
-            # --- Tolérances pour chaque point
-            tol_plus_values = [cotes[n]["tol_plus"] for n in noms]
-            tol_moins_values = [cotes[n]["tol_moins"] for n in noms]
-
-            # Fermer les polygones
-            r_values += [r_values[0]]
-            tol_plus_values += [tol_plus_values[0]]
-            tol_moins_values += [tol_moins_values[0]]
-            theta_values += [theta_values[0]]
+            points = profils_valides[groupe]
+            points = points[np.argsort(angles[points[:, 1]], kind="stable")]
+            k, a = np.r_[points[:, 0], points[0, 0]], np.r_[points[:, 1], points[0, 1]]  # polygones fermés
 
             # --- Construction du radar
             fig_radar = go.Figure()
             fig_radar.add_trace(go.Scatterpolar(
-                r=r_values, theta=theta_values,
+                r=vue[k, a], theta=angles[a],
                 mode='lines+markers', name="Mesure"
             ))
             fig_radar.add_trace(go.Scatterpolar(
-                r=tol_plus_values, theta=theta_values,
+                r=tol_max[k], theta=angles[a],
                 mode='lines', name="Tolérance +", line=dict(dash='dot')
             ))
             fig_radar.add_trace(go.Scatterpolar(
-                r=tol_moins_values, theta=theta_values,
+                r=tol_min[k], theta=angles[a],
                 mode='lines', name="Tolérance -", line=dict(dash='dot')
             ))
 
-            base = cotes[noms[0]]["base"]
-            tol_plus = cotes[noms[0]]["tol_plus"]
-            tol_moins = cotes[noms[0]]["tol_moins"]
-            marge = max(abs(tol_plus - base), abs(tol_moins - base)) + 0.1
+            base = nominal[k[0]]
+            marge = max(abs(tol_max[k[0]] - base), abs(tol_min[k[0]] - base)) + 0.1
 
             fig_radar.update_layout(
                 title=f"📐 Groupe : {groupe}",
@@ -380,3 +376,49 @@ def analyser_rayons(df_rayon):
             )
 
             st.plotly_chart(fig_radar, use_container_width=False)
+
+    afficher_defauts_forme(df_rayon, infos)
+
+
+def afficher_defauts_forme(df_rayon, infos):
+    st.markdown("## ⭕ Défauts de forme (circularité, cylindricité)")
+
+    # Profil d'un point : la cote elle-même si elle est mesurée sur au moins 4 angles,
+    # sinon son groupe de profil (cotes ANGx d'un même cercle)
+    d = df_rayon.dropna(subset=["Angle_Degres", "Mesure"])
+    n_angles = d.groupby("Nom_Cote", observed=True)["Angle_Degres"].nunique()
+    if "Groupe_Profil" in d.columns:
+        groupe = d["Groupe_Profil"].astype(object).where(d["Groupe_Profil"].notna(), "Sans groupe").astype(str)
+    else:
+        groupe = d["Nom_Cote"].map(lambda n: infos.get(n, {}).get("Groupe_Profil") or "Sans groupe").astype(str)
+    d = d.assign(Profil=np.where(d["Nom_Cote"].map(n_angles).to_numpy() >= 4, d["Nom_Cote"].astype(str), groupe))
+
+    ecarts = ecarts_de_forme(d)
+    if ecarts.empty or ecarts["Circularité LSQ"].isna().all():
+        st.info("Au moins 4 points angulaires par profil sont nécessaires pour évaluer la forme "
+                "(3 points définissent toujours un cercle exact).")
+        return
+
+    # Tolérances GPS de forme demandées dans cotes_info
+    gps = d.assign(_gps=d["Nom_Cote"].map(lambda n: ", ".join(
+        t for t in infos.get(n, {}).get("Tolérances_GPS", []) if t in ("Circularité", "Cylindricité"))))
+    gps = gps.groupby("Profil")["_gps"].agg(lambda v: ", ".join(sorted({t for x in v for t in x.split(", ") if t})))
+
+    tolerance_forme = st.number_input("Tolérance de forme (mm)", min_value=0.0, value=0.1, step=0.01, format="%.3f")
+    synthese = synthese_forme(ecarts)
+    synthese.insert(2, "GPS demandé", synthese["Profil"].map(gps).fillna(""))
+    # Logique à trois états : un défaut non évaluable (NaN) ne rend jamais la cote conforme
+    # (NA, affiché « non évaluable »), mais un défaut évalué hors tolérance la rend non conforme
+    conforme = None
+    for colonne in ["Circularité MZ max", "Cylindricité max"]:
+        critere = pd.array(synthese[colonne] <= tolerance_forme, dtype="boolean")
+        critere[synthese[colonne].isna().to_numpy()] = pd.NA
+        conforme = critere if conforme is None else conforme & critere
+    synthese["Conforme"] = conforme
+
+    st.dataframe(synthese.style.format({
+        "Circularité LSQ max": "{:.4f}", "Circularité MZ moyenne": "{:.4f}", "Circularité MZ max": "{:.4f}",
+        "Excentricité max": "{:.4f}", "Cylindricité max": "{:.4f}",
+    }, na_rep="non évaluable"), use_container_width=True)
+    with st.expander("Détail par pièce et par section"):
+        st.dataframe(ecarts, use_container_width=True)
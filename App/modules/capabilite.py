@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+from scipy.stats import chi2
+
+# --- Indicateurs de capabilité par cote (ou cote x OF), en une agrégation ---
+# Cp / Cpk : dispersion court terme (étendue mobile MR̄ / d2, ordre chronologique)
+# Pp / Ppk : dispersion long terme (écart-type global)
+# Cpm      : capabilité Taguchi, pénalise l'écart à la cible (Nominal)
+# IC       : Cp / Pp : loi du Chi² à n - 1 degrés de liberté (approchée pour Cp,
+#            σ estimé par MR̄ / d2) ; Cpk / Ppk : approximation normale de Bissell
+
+D2_MR = 1.128  # constante d2 pour des étendues mobiles de 2 valeurs
+
+COLONNES_CAPABILITE = [
+    "N Mesures", "Moyenne", "Écart-type", "Écart moyen absolu",
+    "Cp", "Cpk", "Pp", "Ppk", "Cpm",
+    "Cp IC bas", "Cp IC haut", "Cpk IC bas", "Cpk IC haut",
+    "Pp IC bas", "Pp IC haut", "Ppk IC bas", "Ppk IC haut",
+    "% hors tolérance",
+]
+
+
+def _ratio(num, den):
+    num = np.asarray(num, dtype=float)
+    den = np.asarray(den, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(den > 0, num / den, np.nan)
+
+
+def calculer_capabilite(df: pd.DataFrame, par=("Nom_Cote",), colonne_ordre="Date",
+                        confiance: float = 0.95) -> pd.DataFrame:
+    par = list(par)
+    cols = par + ["Mesure", "Nominal", "Tolérance_Min", "Tolérance_Max"]
+    if colonne_ordre in df.columns and colonne_ordre not in cols:
+        cols.append(colonne_ordre)
+    d = df[cols].dropna(subset=["Mesure"])
+
+    # Tri (groupe, ordre chronologique) pour les étendues mobiles
+    tri = par + ([colonne_ordre] if colonne_ordre in d.columns else [])
+    d = d.sort_values(tri, kind="stable")
+
+    mesure = d["Mesure"].to_numpy(dtype=float)
+    groupe = d.groupby(par, sort=False, observed=True).ngroup().to_numpy()
+    mr = np.abs(np.diff(mesure, prepend=np.nan))
+    mr[np.r_[True, groupe[1:] != groupe[:-1]]] = np.nan
+
+    d = d.assign(
+        _x=mesure,
+        _mr=mr,
+        _abs_ecart=np.abs(mesure - d["Nominal"].to_numpy(dtype=float)),
+        _hors_tol=(d["Mesure"] < d["Tolérance_Min"]) | (d["Mesure"] > d["Tolérance_Max"]),
+    )
+
+    agg = d.groupby(par, sort=True, observed=True).agg(
+        n=("_x", "count"),
+        moyenne=("_x", "mean"),
+        sigma=("_x", "std"),
+        mr_moyen=("_mr", "mean"),
+        abs_ecart=("_abs_ecart", "mean"),
+        hors_tol=("_hors_tol", "mean"),
+        nominal=("Nominal", "first"),
+        lsl=("Tolérance_Min", "first"),
+        usl=("Tolérance_Max", "first"),
+    )
+
+    n = agg["n"].to_numpy(dtype=float)
+    mu = agg["moyenne"].to_numpy(dtype=float)
+    s_lt = agg["sigma"].to_numpy(dtype=float)
+    s_ct = agg["mr_moyen"].to_numpy(dtype=float) / D2_MR
+    lsl = agg["lsl"].to_numpy(dtype=float)
+    usl = agg["usl"].to_numpy(dtype=float)
+    cible = agg["nominal"].to_numpy(dtype=float)
+
+    etendue = usl - lsl
+    marge = np.minimum(usl - mu, mu - lsl)
+
+    res = pd.DataFrame(index=agg.index)
+    res["N Mesures"] = agg["n"].astype(int)
+    res["Moyenne"] = mu
+    res["Écart-type"] = s_lt
+    res["Écart moyen absolu"] = agg["abs_ecart"].to_numpy()
+    res["Cp"] = _ratio(etendue, 6 * s_ct)
+    res["Cpk"] = _ratio(marge, 3 * s_ct)
+    res["Pp"] = _ratio(etendue, 6 * s_lt)
+    res["Ppk"] = _ratio(marge, 3 * s_lt)
+    res["Cpm"] = _ratio(etendue, 6 * np.sqrt(s_lt ** 2 + (mu - cible) ** 2))
+
+    alpha = 1 - confiance
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ddl = np.where(n > 1, n - 1, np.nan)
+        for nom in ["Cp", "Pp"]:
+            c = res[nom].to_numpy()
+            res[f"{nom} IC bas"] = c * np.sqrt(chi2.ppf(alpha / 2, ddl) / ddl)
+            res[f"{nom} IC haut"] = c * np.sqrt(chi2.ppf(1 - alpha / 2, ddl) / ddl)
+
+    z = NormalDist().inv_cdf(0.5 + confiance / 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for nom in ["Cpk", "Ppk"]:
+            k = res[nom].to_numpy()
+            se = np.sqrt(1 / (9 * n) + k ** 2 / (2 * (n - 1)))
+            res[f"{nom} IC bas"] = np.where(n > 1, k - z * se, np.nan)
+            res[f"{nom} IC haut"] = np.where(n > 1, k + z * se, np.nan)
+
+    res["% hors tolérance"] = 100 * agg["hors_tol"].to_numpy(dtype=float)
+    return res.reset_index()
+
+
+FORMAT_CAPABILITE = {
+    "N Mesures": "{:.0f}",
+    "Moyenne": "{:.3f}",
+    "Écart-type": "{:.3f}",
+    "Écart moyen absolu": "{:.3f}",
+    "Cp": "{:.2f}", "Cpk": "{:.2f}",
+    "Pp": "{:.2f}", "Ppk": "{:.2f}", "Cpm": "{:.2f}",
+    "Cp IC bas": "{:.2f}", "Cp IC haut": "{:.2f}",
+    "Cpk IC bas": "{:.2f}", "Cpk IC haut": "{:.2f}",
+    "Pp IC bas": "{:.2f}", "Pp IC haut": "{:.2f}",
+    "Ppk IC bas": "{:.2f}", "Ppk IC haut": "{:.2f}",
+    "% hors tolérance": "{:.1f} %",
+}
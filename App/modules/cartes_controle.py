@@ -0,0 +1,188 @@
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from scipy.integrate import quad, dblquad
+from scipy.special import gammaln, ndtr
+
+# --- Cartes de contrôle SPC, calculées pour toutes les cotes à la fois ---
+# Toutes les séries sont concaténées (triées par cote puis par date) ; les
+# récurrences (EWMA, CUSUM) et les règles de Western Electric sont évaluées
+# en O(n) sur ce tableau, avec remise à zéro à chaque début de cote.
+
+# Constantes d2 / d3 des cartes aux étendues, n = 2..25
+D2 = np.array([np.nan, np.nan, 1.128, 1.693, 2.059, 2.326, 2.534, 2.704, 2.847, 2.970, 3.078,
+               3.173, 3.258, 3.336, 3.407, 3.472, 3.532, 3.588, 3.640, 3.689, 3.735,
+               3.778, 3.819, 3.858, 3.895, 3.931])
+D3 = np.array([np.nan, np.nan, 0.853, 0.888, 0.880, 0.864, 0.848, 0.833, 0.820, 0.808, 0.797,
+               0.787, 0.778, 0.770, 0.763, 0.756, 0.750, 0.744, 0.739, 0.733, 0.729,
+               0.724, 0.720, 0.716, 0.712, 0.708])
+N_MAX_TABLE = len(D2) - 1
+BORNE_INTEGRATION = 10.0  # en σ : au-delà, la loi normale ne contribue plus
+
+
+def c4(n):
+    n = np.asarray(n, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lg = np.where(n > 1, gammaln(n / 2) - gammaln((n - 1) / 2), np.nan)
+        return np.sqrt(2 / (n - 1)) * np.exp(lg)
+
+
+@lru_cache(maxsize=None)
+def _d2_d3_integres(n: int):
+    # Au-delà de la table : moments de l'étendue d'un échantillon normal de taille n
+    # E[R] = ∫ 1 - Φ(x)^n - (1 - Φ(x))^n dx
+    # E[R²] = 2 ∫∫_{x<y} 1 - Φ(y)^n - (1 - Φ(x))^n + (Φ(y) - Φ(x))^n dy dx
+    b = BORNE_INTEGRATION
+    d2 = quad(lambda x: 1 - ndtr(x) ** n - (1 - ndtr(x)) ** n, -b, b)[0]
+    r2 = 2 * dblquad(lambda y, x: 1 - ndtr(y) ** n - (1 - ndtr(x)) ** n + (ndtr(y) - ndtr(x)) ** n,
+                     -b, b, lambda x: x, lambda x: b)[0]
+    return d2, np.sqrt(r2 - d2 ** 2)
+
+
+def constantes_etendue(n):
+    # d2, d3 par sous-groupe : table jusqu'à 25, intégration numérique au-delà
+    n = np.asarray(n, dtype=int)
+    d2, d3 = D2[np.clip(n, 0, N_MAX_TABLE)], D3[np.clip(n, 0, N_MAX_TABLE)]
+    for taille in np.unique(n[n > N_MAX_TABLE]):
+        d2[n == taille], d3[n == taille] = _d2_d3_integres(int(taille))
+    return d2, d3
+
+
+def _debuts_de_groupe(codes):
+    return np.r_[True, codes[1:] != codes[:-1]]
+
+
+def _rang_dans_groupe(debuts):
+    # Position 0, 1, 2... de chaque point dans sa série
+    idx = np.arange(len(debuts))
+    return idx - np.maximum.accumulate(np.where(debuts, idx, 0))
+
+
+def _somme_glissante(indic, fenetre, rang):
+    # Nombre d'indicateurs vrais sur les `fenetre` derniers points de la même série
+    cs = np.r_[0, np.cumsum(indic, dtype=np.int64)]
+    i = np.arange(len(indic))
+    debut = np.maximum(i - fenetre + 1, i - rang)
+    return cs[i + 1] - cs[debut]
+
+
+# --- X̄-R / X̄-S par sous-groupe (OF par défaut) ---
+def limites_xbar(df: pd.DataFrame, sous_groupe="OF") -> pd.DataFrame:
+    d = df.dropna(subset=["Mesure"])
+    g = d.groupby(["Nom_Cote", sous_groupe], sort=True, observed=True)["Mesure"]
+    sg = g.agg(n="count", Xbar="mean", S="std", Xmax="max", Xmin="min").reset_index()
+    sg["R"] = sg.pop("Xmax") - sg.pop("Xmin")
+
+    n = sg["n"].to_numpy()
+    d2, d3 = constantes_etendue(n)
+    c4n = c4(n)
+    valide = n > 1
+
+    # σ estimé par cote : moyenne des R_i / d2(n_i) et des S_i / c4(n_i)
+    sg["_sigma_R"] = np.where(valide, sg["R"] / d2, np.nan)
+    sg["_sigma_S"] = np.where(valide, sg["S"] / c4n, np.nan)
+    par_cote = sg.groupby("Nom_Cote", sort=False, observed=True)
+    x_bar_bar = par_cote["Xbar"].transform("mean").to_numpy()
+    sigma_r = par_cote["_sigma_R"].transform("mean").to_numpy()
+    sigma_s = par_cote["_sigma_S"].transform("mean").to_numpy()
+
+    racine_n = np.sqrt(n)
+    sg["Centre"] = x_bar_bar
+    sg["LCI X̄"] = x_bar_bar - 3 * sigma_r / racine_n
+    sg["LCS X̄"] = x_bar_bar + 3 * sigma_r / racine_n
+    sg["Centre R"] = d2 * sigma_r
+    sg["LCI R"] = np.maximum(0, (d2 - 3 * d3) * sigma_r)
+    sg["LCS R"] = (d2 + 3 * d3) * sigma_r
+    sg["LCI X̄ (S)"] = x_bar_bar - 3 * sigma_s / racine_n
+    sg["LCS X̄ (S)"] = x_bar_bar + 3 * sigma_s / racine_n
+    sg["Centre S"] = c4n * sigma_s
+    sg["LCI S"] = np.maximum(0, (c4n - 3 * np.sqrt(1 - c4n ** 2)) * sigma_s)
+    sg["LCS S"] = (c4n + 3 * np.sqrt(1 - c4n ** 2)) * sigma_s
+    sg["Hors limites X̄"] = (sg["Xbar"] < sg["LCI X̄"]) | (sg["Xbar"] > sg["LCS X̄"])
+    sg["Hors limites R"] = valide & ((sg["R"] < sg["LCI R"]) | (sg["R"] > sg["LCS R"]))
+    return sg.drop(columns=["_sigma_R", "_sigma_S"])
+
+
+# --- Cartes aux valeurs individuelles : EWMA, CUSUM, règles WE ---
+def calculer_cartes(df: pd.DataFrame, lambda_ewma: float = 0.2, L: float = 3.0,
+                    k: float = 0.5, h: float = 5.0, cible: str = "moyenne") -> pd.DataFrame:
+    # cible = "moyenne" (phase I, centre estimé) ou "nominal"
+    # k et h sont exprimés en σ (réglage classique k = 0.5, h = 4 à 5)
+    colonnes = [c for c in ["Date", "Serial", "OF", "Nom_Cote", "Mesure", "Nominal"] if c in df.columns]
+    d = df[colonnes].dropna(subset=["Mesure"])
+    d = d.sort_values(["Nom_Cote", "Date"] if "Date" in d.columns else ["Nom_Cote"], kind="stable")
+    d = d.reset_index(drop=True)
+
+    x = d["Mesure"].to_numpy(dtype=float)
+    codes = d.groupby("Nom_Cote", sort=False, observed=True).ngroup().to_numpy()
+    debuts = _debuts_de_groupe(codes)
+    rang = _rang_dans_groupe(debuts)
+
+    # Centre et σ court terme (MR̄ / d2) par cote
+    mr = np.abs(np.diff(x, prepend=np.nan))
+    mr[debuts] = np.nan
+    n_cotes = codes.max() + 1 if len(codes) else 0
+    somme_mr = np.bincount(codes, weights=np.nan_to_num(mr), minlength=n_cotes)
+    nb_mr = np.bincount(codes, weights=~np.isnan(mr), minlength=n_cotes)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma = (somme_mr / nb_mr / D2[2])[codes]
+    if cible == "nominal" and "Nominal" in d.columns:
+        mu = d["Nominal"].to_numpy(dtype=float)
+    else:
+        mu = (np.bincount(codes, weights=x, minlength=n_cotes) / np.bincount(codes, minlength=n_cotes))[codes]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (x - mu) / sigma
+
+    # EWMA : z_t = λ e_t + (1 - λ) z_{t-1}, z_0 = 0 (écart à la cible).
+    # ewm(adjust=False) démarre à e_1 ; on retire le terme (1-λ)^t e_1 en trop.
+    e = pd.Series(x - mu)
+    y = (e.groupby(codes, sort=False).ewm(alpha=lambda_ewma, adjust=False).mean()
+         .reset_index(level=0, drop=True).sort_index().to_numpy())
+    t = rang + 1
+    e1 = (x - mu)[np.maximum.accumulate(np.where(debuts, np.arange(len(x)), 0))]
+    ewma = y - (1 - lambda_ewma) ** t * e1
+    demi_largeur = L * sigma * np.sqrt(lambda_ewma / (2 - lambda_ewma) * (1 - (1 - lambda_ewma) ** (2 * t)))
+
+    # CUSUM tabulaire via la récursion de Lindley : C_t = S_t - min(0, min_{j<=t} S_j)
+    def cusum(incr):
+        s = pd.Series(incr).groupby(codes, sort=False).cumsum().to_numpy()
+        m = pd.Series(s).groupby(codes, sort=False).cummin().to_numpy()
+        return s - np.minimum(m, 0)
+
+    cusum_haut = cusum(np.nan_to_num(z - k))
+    cusum_bas = cusum(np.nan_to_num(-z - k))
+
+    # Règles de Western Electric (fenêtres glissantes par série)
+    au_dessus, en_dessous = z > 0, z < 0
+    regle_1 = np.abs(z) > 3
+    regle_2 = (_somme_glissante((z > 2), 3, rang) >= 2) | (_somme_glissante((z < -2), 3, rang) >= 2)
+    regle_3 = (_somme_glissante((z > 1), 5, rang) >= 4) | (_somme_glissante((z < -1), 5, rang) >= 4)
+    regle_4 = (_somme_glissante(au_dessus, 8, rang) >= 8) | (_somme_glissante(en_dessous, 8, rang) >= 8)
+
+    d["Centre"] = mu
+    d["Sigma"] = sigma
+    d["z"] = z
+    d["EWMA"] = mu + ewma
+    d["EWMA LCI"] = mu - demi_largeur
+    d["EWMA LCS"] = mu + demi_largeur
+    d["CUSUM +"] = cusum_haut
+    d["CUSUM -"] = cusum_bas
+    d["Règle 1"] = regle_1
+    d["Règle 2"] = regle_2
+    d["Règle 3"] = regle_3
+    d["Règle 4"] = regle_4
+    d["Alarme EWMA"] = (d["EWMA"] < d["EWMA LCI"]) | (d["EWMA"] > d["EWMA LCS"])
+    d["Alarme CUSUM"] = (cusum_haut > h) | (cusum_bas > h)
+    d["Alarme"] = regle_1 | regle_2 | regle_3 | regle_4 | d["Alarme EWMA"].to_numpy() | d["Alarme CUSUM"].to_numpy()
+    return d
+
+
+def synthese_alarmes(cartes: pd.DataFrame) -> pd.DataFrame:
+    # Une ligne par cote, triée par nombre d'alarmes décroissant
+    colonnes = ["Règle 1", "Règle 2", "Règle 3", "Règle 4", "Alarme EWMA", "Alarme CUSUM", "Alarme"]
+    res = cartes.groupby("Nom_Cote", observed=True)[colonnes].sum()
+    res.insert(0, "N Mesures", cartes.groupby("Nom_Cote", observed=True).size())
+    if "Date" in cartes.columns:
+        premiere = cartes[cartes["Alarme"]].groupby("Nom_Cote", observed=True)["Date"].min()
+        res["Première alarme"] = premiere
+    return res.sort_values("Alarme", ascending=False).reset_index()
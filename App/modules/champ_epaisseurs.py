@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+# --- Champ d'épaisseur multi-pièces ---
+# Pour une cote d'épaisseur, les mesures sont rangées dans une matrice
+# [pièce, position] (NaN si la pièce n'a pas été palpée à cette position).
+# Les enveloppes par position (moyenne, σ, min / max, Cpk, % hors tolérance)
+# sont des réductions le long de l'axe pièces, et la grille régulière pour la
+# carte de chaleur est une interpolation linéaire le long de l'axe positions,
+# toutes pièces en une seule opération.
+
+N_POSITIONS_GRILLE = 200
+DECIMALES_POSITION = 6
+
+
+def matrice_epaisseurs(df_cote: pd.DataFrame, piece: str = "Serial") -> dict:
+    # df_cote : une cote, colonnes Position, Mesure, Nominal, Tolérance_Min, Tolérance_Max (+ pièce)
+    d = df_cote.dropna(subset=["Position", "Mesure"])
+    pieces_brutes = d[piece].astype(str) if piece in d.columns else pd.Series("", index=d.index)
+    code_piece, pieces = pd.factorize(pieces_brutes, sort=True)
+    code_pos, positions = pd.factorize(d["Position"].astype(float).round(DECIMALES_POSITION), sort=True)
+
+    # Une mesure par (pièce, position) : moyenne des répétitions éventuelles
+    cellule = code_piece * len(positions) + code_pos
+    taille = len(pieces) * len(positions)
+    somme = np.bincount(cellule, weights=d["Mesure"].to_numpy(dtype=float), minlength=taille)
+    compte = np.bincount(cellule, minlength=taille)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mesures = (somme / compte).reshape(len(pieces), len(positions))
+
+    # Tolérances par position (première valeur rencontrée)
+    premier = np.unique(code_pos, return_index=True)[1]
+    return {
+        "pieces": np.asarray(pieces),
+        "positions": np.asarray(positions, dtype=float),
+        "mesures": mesures,
+        "nominal": d["Nominal"].to_numpy(dtype=float)[premier],
+        "tol_min": d["Tolérance_Min"].to_numpy(dtype=float)[premier],
+        "tol_max": d["Tolérance_Max"].to_numpy(dtype=float)[premier],
+    }
+
+
+def enveloppes(matrice: dict) -> pd.DataFrame:
+    m = matrice["mesures"]
+    valides = ~np.isnan(m)
+    n = valides.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        moyenne = np.where(valides, m, 0.0).sum(axis=0) / n
+        sigma = np.sqrt(np.where(valides, (m - moyenne) ** 2, 0.0).sum(axis=0) / (n - 1))
+        cpk = np.minimum(matrice["tol_max"] - moyenne, moyenne - matrice["tol_min"]) / (3 * sigma)
+        hors_tol = ((m < matrice["tol_min"]) | (m > matrice["tol_max"])).sum(axis=0) / n
+    return pd.DataFrame({
+        "Position": matrice["positions"],
+        "N": n,
+        "Moyenne": moyenne,
+        "Écart-type": np.where(n > 1, sigma, np.nan),
+        "Min": np.where(valides, m, np.inf).min(axis=0, initial=np.inf),
+        "Max": np.where(valides, m, -np.inf).max(axis=0, initial=-np.inf),
+        "Nominal": matrice["nominal"],
+        "Tolérance_Min": matrice["tol_min"],
+        "Tolérance_Max": matrice["tol_max"],
+        "Cpk": np.where((n > 1) & (sigma > 0), cpk, np.nan),
+        "% Hors Tol": 100 * hors_tol,
+    })
+
+
+def grille_reguliere(matrice: dict, n_positions: int = N_POSITIONS_GRILLE, valeurs=None):
+    # Interpolation linéaire de chaque ligne [pièce, position] sur une grille régulière.
+    # Un point de grille entre deux positions dont l'une manque reste NaN.
+    positions = matrice["positions"]
+    valeurs = matrice["mesures"] if valeurs is None else valeurs
+    if len(positions) < 2:
+        return positions.copy(), valeurs.copy()
+    grille = np.linspace(positions[0], positions[-1], n_positions)
+    droite = np.clip(np.searchsorted(positions, grille, side="right"), 1, len(positions) - 1)
+    gauche = droite - 1
+    poids = (grille - positions[gauche]) / (positions[droite] - positions[gauche])
+    return grille, valeurs[:, gauche] * (1 - poids) + valeurs[:, droite] * poids
@@ -0,0 +1,300 @@
+import numpy as np
+import pandas as pd
+
+# --- Moteur de comparaison cire / métal ---
+# Une clé de cote normalisée est construite une seule fois par nom distinct
+# (préfixe "Cire_" retiré, séparateur décimal unifié, espaces superflus
+# supprimés), puis cire et métal sont appariés par jointure de hachage sur
+# (Serial ou OF, cote). La clé ne sert qu'à l'appariement : la colonne
+# Nom_Cote_Normalisé affiche le nom d'origine (préfixe retiré) de la première
+# cote rencontrée pour cette clé, côté métal d'abord. Retrait et décalage sont
+# calculés pour toutes les paires et toutes les cotes en une fois.
+
+PREFIXES_CIRE = ("Cire_", "Cire ")
+CLES_APPARIEMENT = ["Serial", "OF"]
+
+
+def _libelle_cote(nom) -> str:
+    nom = str(nom).strip()
+    for prefixe in PREFIXES_CIRE:
+        if nom.startswith(prefixe):
+            return nom[len(prefixe):].strip()
+    return nom
+
+
+def _cle_cote(nom) -> str:
+    # Clé d'appariement seulement : "12.5" et "12,5", espaces multiples ou non, désignent la même cote
+    return " ".join(_libelle_cote(nom).replace(".", ",").split())
+
+
+def normaliser_noms_cotes(noms: pd.Series, reference: pd.Series = None) -> pd.Series:
+    # Libellé commun par clé, calculé sur les seuls noms distincts puis diffusé par leurs codes.
+    # reference (noms métal) : ses libellés priment, pour que cire et métal s'affichent pareil.
+    libelles = {}
+    if reference is not None:
+        for nom in pd.unique(reference.dropna()):
+            libelles.setdefault(_cle_cote(nom), _libelle_cote(nom))
+    codes, uniques = pd.factorize(noms, sort=False)
+    normalises = np.array([libelles.setdefault(_cle_cote(n), _libelle_cote(n)) for n in uniques] + [None],
+                          dtype=object)
+    return pd.Series(normalises[codes], index=noms.index, name="Nom_Cote_Normalisé")
+
+
+def empiler_cire_metal(df_metal: pd.DataFrame, df_cire: pd.DataFrame, reference: pd.Series = None) -> pd.DataFrame:
+    # Vue « longue » des deux jeux (graphiques), sans modifier les DataFrames d'origine.
+    # reference : noms métal complets si df_metal n'en est qu'un extrait
+    reference = df_metal["Nom_Cote"] if reference is None else reference
+    return pd.concat([
+        df_metal.assign(Nom_Cote_Normalisé=normaliser_noms_cotes(df_metal["Nom_Cote"], reference), Type="Métal"),
+        df_cire.assign(Nom_Cote_Normalisé=normaliser_noms_cotes(df_cire["Nom_Cote"], reference), Type="Cire"),
+    ], ignore_index=True)
+
+
+def _reduire(df: pd.DataFrame, cle: str, reference: pd.Series = None) -> pd.DataFrame:
+    # Une ligne par (clé, cote) : moyenne si la cote est mesurée plusieurs fois
+    d = pd.DataFrame({
+        cle: df[cle].astype(str).to_numpy(),
+        "Nom_Cote_Normalisé": normaliser_noms_cotes(df["Nom_Cote"], reference).to_numpy(),
+        "Mesure": df["Mesure"].to_numpy(dtype=float),
+        "Nominal": df["Nominal"].to_numpy(dtype=float),
+    })
+    d = d.dropna(subset=["Mesure", "Nom_Cote_Normalisé"])
+    return d.groupby([cle, "Nom_Cote_Normalisé"], sort=False).agg(
+        Mesure=("Mesure", "mean"), Nominal=("Nominal", "first"), N=("Mesure", "count"),
+    )
+
+
+def apparier_cire_metal(df_metal: pd.DataFrame, df_cire: pd.DataFrame, cle: str = "Serial") -> pd.DataFrame:
+    # Paires cire / métal ; Retrait = (cire - métal) / cire, Facteur = métal / cire
+    metal = _reduire(df_metal, cle)
+    cire = _reduire(df_cire, cle, df_metal["Nom_Cote"])
+    paires = cire.join(metal, how="inner", lsuffix="_Cire", rsuffix="_Métal").reset_index()
+
+    m_cire = paires["Mesure_Cire"].to_numpy()
+    m_metal = paires["Mesure_Métal"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        paires["Décalage"] = m_metal - m_cire
+        paires["Facteur"] = m_metal / m_cire
+        paires["Retrait (%)"] = 100 * (m_cire - m_metal) / m_cire
+    return paires
+
+
+def retraits_par_cote(paires: pd.DataFrame) -> pd.DataFrame:
+    # Facteur de retrait moyen par cote et dispersion du décalage cire → métal
+    res = paires.groupby("Nom_Cote_Normalisé", sort=True).agg(
+        N_Paires=("Décalage", "count"),
+        Cire_Moyenne=("Mesure_Cire", "mean"),
+        Métal_Moyenne=("Mesure_Métal", "mean"),
+        Décalage_Moyen=("Décalage", "mean"),
+        Décalage_Écart_type=("Décalage", "std"),
+        Facteur_Moyen=("Facteur", "mean"),
+        Retrait_Moyen=("Retrait (%)", "mean"),
+        Retrait_Écart_type=("Retrait (%)", "std"),
+    )
+    res.columns = ["N Paires", "Cire (moyenne)", "Métal (moyenne)", "Décalage moyen", "Décalage σ",
+                   "Facteur métal / cire", "Retrait moyen (%)", "Retrait σ (%)"]
+    return res.reset_index()
+
+
+# --- Rapport statistique cire / métal, toutes cotes à la fois ---
+# Moments par groupe (agrégation groupée), test t de Welch, statistique de
+# Kolmogorov-Smirnov à deux échantillons (un seul tri de toutes les valeurs
+# par cote, fonctions de répartition empiriques par sommes cumulées) et
+# capabilité de chaque côté.
+def _ks_par_groupe(codes, valeurs, est_metal, n_groupes):
+    ordre = np.lexsort((valeurs, codes))
+    c, v, m = codes[ordre], valeurs[ordre], est_metal[ordre]
+    n_metal = np.bincount(c, weights=m, minlength=n_groupes)
+    n_cire = np.bincount(c, weights=~m, minlength=n_groupes)
+    debuts = np.flatnonzero(np.r_[True, c[1:] != c[:-1]])
+    # Cumuls remis à zéro à chaque début de groupe
+    cum_m = np.cumsum(m)
+    cum_c = np.cumsum(~m)
+    base = np.repeat(np.r_[0, cum_m[debuts[1:] - 1]], np.diff(np.r_[debuts, len(c)]))
+    base_c = np.repeat(np.r_[0, cum_c[debuts[1:] - 1]], np.diff(np.r_[debuts, len(c)]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ecart = np.abs((cum_m - base) / n_metal[c] - (cum_c - base_c) / n_cire[c])
+    # Les F.R. ne s'évaluent qu'en fin de bloc d'ex aequo
+    fin_bloc = np.r_[(v[1:] != v[:-1]) | (c[1:] != c[:-1]), True]
+    ecart = np.where(fin_bloc, np.nan_to_num(ecart), 0.0)
+    d = np.zeros(n_groupes)
+    d[c[debuts]] = np.maximum.reduceat(ecart, debuts)
+    return d
+
+
+def rapport_comparaison(df_metal: pd.DataFrame, df_cire: pd.DataFrame, base: str = "Mesure") -> pd.DataFrame:
+    # base = "Mesure" ou "Écart" (mesure - nominale de chaque côté)
+    from scipy.special import kolmogorov
+    from scipy.stats import t as student
+    from modules.capabilite import calculer_capabilite
+
+    d = empiler_cire_metal(df_metal, df_cire).dropna(subset=["Mesure", "Nom_Cote_Normalisé"])
+    valeurs = d["Mesure"].to_numpy(dtype=float)
+    if base == "Écart":
+        valeurs = valeurs - d["Nominal"].to_numpy(dtype=float)
+    d = d.assign(_v=valeurs)
+
+    stats = d.groupby(["Nom_Cote_Normalisé", "Type"], sort=True).agg(n=("_v", "count"), moy=("_v", "mean"), var=("_v", "var"))
+    stats = stats.unstack("Type")
+    stats = stats[[("n", "Cire"), ("n", "Métal")]].join(stats.drop(columns=["n"]))
+    cotes = stats.index
+    n_c = stats[("n", "Cire")].fillna(0).to_numpy()
+    n_m = stats[("n", "Métal")].fillna(0).to_numpy()
+    moy_c, moy_m = stats[("moy", "Cire")].to_numpy(), stats[("moy", "Métal")].to_numpy()
+    var_c, var_m = stats[("var", "Cire")].to_numpy(), stats[("var", "Métal")].to_numpy()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        se2_c, se2_m = var_c / n_c, var_m / n_m
+        t = (moy_m - moy_c) / np.sqrt(se2_c + se2_m)
+        ddl = (se2_c + se2_m) ** 2 / (se2_c ** 2 / (n_c - 1) + se2_m ** 2 / (n_m - 1))
+        p_t = 2 * student.sf(np.abs(t), ddl)
+
+        codes = pd.Categorical(d["Nom_Cote_Normalisé"], categories=cotes).codes
+        ks = _ks_par_groupe(codes, d["_v"].to_numpy(), (d["Type"] == "Métal").to_numpy(), len(cotes))
+        n_eff = n_c * n_m / (n_c + n_m)
+        p_ks = kolmogorov(np.sqrt(n_eff) * ks)
+
+    res = pd.DataFrame({
+        "Nom_Cote_Normalisé": cotes,
+        "N Cire": n_c.astype(int),
+        "N Métal": n_m.astype(int),
+        "Moyenne Cire": moy_c,
+        "Moyenne Métal": moy_m,
+        "Décalage moyen": moy_m - moy_c,
+        "Ratio variances (M/C)": var_m / var_c,
+        "t Welch": t,
+        "p Welch": p_t,
+        "KS D": np.where((n_c > 0) & (n_m > 0), ks, np.nan),
+        "p KS": np.where((n_c > 0) & (n_m > 0), p_ks, np.nan),
+    })
+
+    # Capabilité de chaque côté (mêmes indicateurs que l'analyse rapide)
+    for nom, df_cote in [("Cire", df_cire), ("Métal", df_metal)]:
+        cap = calculer_capabilite(df_cote.assign(Nom_Cote_Normalisé=normaliser_noms_cotes(df_cote["Nom_Cote"],
+                                                                                          df_metal["Nom_Cote"])),
+                                  par=("Nom_Cote_Normalisé",))
+        cap = cap.set_index("Nom_Cote_Normalisé")[["Cpk", "Ppk", "% hors tolérance"]]
+        cap.columns = [f"{c} {nom}" for c in cap.columns]
+        res = res.join(cap, on="Nom_Cote_Normalisé")
+
+    return res.sort_values("Décalage moyen", key=np.abs, ascending=False, ignore_index=True)
+
+
+FORMAT_RAPPORT = {
+    "Moyenne Cire": "{:.3f}", "Moyenne Métal": "{:.3f}", "Décalage moyen": "{:.3f}",
+    "Ratio variances (M/C)": "{:.2f}", "t Welch": "{:.2f}", "p Welch": "{:.2e}",
+    "KS D": "{:.3f}", "p KS": "{:.2e}",
+    "Cpk Cire": "{:.2f}", "Ppk Cire": "{:.2f}", "% hors tolérance Cire": "{:.1f} %",
+    "Cpk Métal": "{:.2f}", "Ppk Métal": "{:.2f}", "% hors tolérance Métal": "{:.1f} %",
+}
+
+
+# --- Modèle de retrait cire → métal ---
+# Métal = a + b · Cire (affine) ou Métal = b · Cire (proportionnel), ajusté par
+# moindres carrés pour toutes les cotes (ou tous les types de cote) à la fois :
+# les sommes centrées Σx, Σy, Σxx, Σxy par groupe donnent directement les
+# solutions des équations normales. La prédiction d'un nouveau lot de cire est
+# une indexation des paramètres, puis une loi normale pour le risque de
+# hors tolérance (variance de prédiction incluant l'incertitude des paramètres).
+MODELES_RETRAIT = ["affine", "proportionnel"]
+
+
+def ajuster_retrait(paires: pd.DataFrame, modele: str = "affine", types=None) -> pd.DataFrame:
+    # types : Series cote normalisée → type de cote pour un modèle par type
+    cle = paires["Nom_Cote_Normalisé"]
+    if types is not None:
+        cle = cle.map(types).fillna("Autre")
+    d = pd.DataFrame({"Groupe": cle.to_numpy(),
+                      "x": paires["Mesure_Cire"].to_numpy(dtype=float),
+                      "y": paires["Mesure_Métal"].to_numpy(dtype=float)}).dropna()
+    g = d.groupby("Groupe", sort=True)
+    n = g["x"].count().to_numpy(dtype=float)
+    x_moy = g["x"].mean().to_numpy()
+    y_moy = g["y"].mean().to_numpy()
+    index = g["x"].count().index
+
+    if modele == "proportionnel":
+        d = d.assign(xx=d["x"] * d["x"], xy=d["x"] * d["y"])
+        s = d.groupby("Groupe", sort=True)[["xx", "xy"]].sum()
+        sxx, sxy = s["xx"].to_numpy(), s["xy"].to_numpy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            b = sxy / sxx
+        a = np.zeros_like(b)
+        ddl = n - 1
+    else:
+        # Sommes centrées : évite la perte de précision (cotes ~ 100 mm, dispersion ~ 0.1 mm)
+        code = g.ngroup().to_numpy()
+        dx, dy = d["x"].to_numpy() - x_moy[code], d["y"].to_numpy() - y_moy[code]
+        sxx = np.bincount(code, weights=dx * dx, minlength=len(index))
+        sxy = np.bincount(code, weights=dx * dy, minlength=len(index))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            b = np.where(sxx > 0, sxy / sxx, np.nan)
+        a = y_moy - b * x_moy
+        ddl = n - 2
+
+    code = g.ngroup().to_numpy()
+    residus = d["y"].to_numpy() - (a[code] + b[code] * d["x"].to_numpy())
+    sce = np.bincount(code, weights=residus ** 2, minlength=len(index))
+    sct = np.bincount(code, weights=(d["y"].to_numpy() - y_moy[code]) ** 2, minlength=len(index))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma = np.sqrt(np.where(ddl > 0, sce / ddl, np.nan))
+        r2 = np.where(sct > 0, 1 - sce / sct, np.nan)
+
+    return pd.DataFrame({
+        "N Paires": n.astype(int), "a": a, "b": b, "Retrait (%)": 100 * (1 - y_moy / x_moy),
+        "σ résiduel": sigma, "R²": r2, "x moyen": x_moy, "Sxx": sxx, "Modèle": modele,
+    }, index=pd.Index(index, name="Groupe"))
+
+
+def tolerances_metal(df_metal: pd.DataFrame) -> pd.DataFrame:
+    d = df_metal.assign(Nom_Cote_Normalisé=normaliser_noms_cotes(df_metal["Nom_Cote"]))
+    return d.groupby("Nom_Cote_Normalisé", sort=True)[["Nominal", "Tolérance_Min", "Tolérance_Max"]].first()
+
+
+def predire_metal(parametres: pd.DataFrame, df_cire: pd.DataFrame, tolerances: pd.DataFrame,
+                  types=None) -> pd.DataFrame:
+    # Une ligne par mesure de cire : dimension métal attendue, écart-type de prédiction et P(hors tolérance)
+    from scipy.special import ndtr
+
+    # Libellés alignés sur ceux des tolérances métal
+    cotes = normaliser_noms_cotes(df_cire["Nom_Cote"], tolerances.index.to_series())
+    groupes = cotes.map(types).fillna("Autre") if types is not None else cotes
+    p = parametres.reindex(groupes.to_numpy())
+    tol = tolerances.reindex(cotes.to_numpy())
+    x = df_cire["Mesure"].to_numpy(dtype=float)
+
+    a, b, s = p["a"].to_numpy(), p["b"].to_numpy(), p["σ résiduel"].to_numpy()
+    n, x_moy, sxx = p["N Paires"].to_numpy(dtype=float), p["x moyen"].to_numpy(), p["Sxx"].to_numpy()
+    proportionnel = (p["Modèle"] == "proportionnel").to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        levier = np.where(proportionnel, x ** 2 / sxx, 1 / n + (x - x_moy) ** 2 / sxx)
+        sigma = s * np.sqrt(1 + levier)
+        prevu = a + b * x
+        lsl, usl = tol["Tolérance_Min"].to_numpy(), tol["Tolérance_Max"].to_numpy()
+        p_hors = ndtr((lsl - prevu) / sigma) + 1 - ndtr((usl - prevu) / sigma)
+
+    return pd.DataFrame({
+        "Serial": df_cire["Serial"].to_numpy() if "Serial" in df_cire.columns else None,
+        "OF": df_cire["OF"].to_numpy() if "OF" in df_cire.columns else None,
+        "Nom_Cote_Normalisé": cotes.to_numpy(),
+        "Mesure cire": x,
+        "Métal prévu": prevu,
+        "σ prévision": sigma,
+        "Tolérance_Min": lsl,
+        "Tolérance_Max": usl,
+        "P(hors tolérance)": p_hors,
+    })
+
+
+def risque_par_piece(predictions: pd.DataFrame, par: str = "Serial") -> pd.DataFrame:
+    # P(au moins une cote hors tolérance) en supposant les cotes indépendantes
+    d = predictions.dropna(subset=["P(hors tolérance)"])
+    d = d.assign(_log_ok=np.log1p(-np.clip(d["P(hors tolérance)"].to_numpy(), 0, 1 - 1e-15)))
+    res = d.groupby(par, sort=False).agg(
+        N_Cotes=("Nom_Cote_Normalisé", "count"),
+        _log_ok=("_log_ok", "sum"),
+        P_max=("P(hors tolérance)", "max"),
+    )
+    res["P(pièce hors tolérance)"] = -np.expm1(res.pop("_log_ok"))
+    res = res.rename(columns={"N_Cotes": "N Cotes", "P_max": "P max (une cote)"})
+    return res.sort_values("P(pièce hors tolérance)", ascending=False).reset_index()
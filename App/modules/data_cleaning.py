@@ -49,75 +49,226 @@
 
 #     df_long = pd.DataFrame(records)
 #     return df_long
+import os
 import pandas as pd
+import numpy as np
+import hashlib
+import threading
+from collections import OrderedDict
 from io import StringIO
 import streamlit as st
+from modules.format_compact import compacter_mesures, joindre_tolerances
+from modules.types_cotes import detecter_type
+from modules.meta_cotes import enrichir_mesures
+from modules.index_angulaire import completer_cotes_info
 
 
-def detect_type(nom):
-    nom = nom.lower()
-    if "rayon" in nom:
-        return "Rayon"
-    elif "diam" in nom or "ø" in nom:
-        return "Diamètre extérieur"
-    elif "épais" in nom or "patin" in nom:
-        return "Épaisseur"
-    elif "largeur" in nom or "hauteur" in nom or "gorge" in nom:
-        return "Longueur"
-    elif "perçage" in nom:
-        return "Diamètre extérieur"
-    elif "alésage" in nom:
-        return "Alésage"
-    elif "angle" in nom:
-        return "Angle"
-    else:
-        return "Autre"
+# --- Structure du format BRUT (export machine de mesure) ---
+ROW_COTE_NAMES = 2
+ROW_MIN = 5
+ROW_AIM = 6
+ROW_MAX = 7
+ROW_DATA_START = 10
+COLUMN_DATA_START = 7
+COLUMN_DATETIME = 0
+COLUMN_SERIAL = 1
+COLUMN_PLATCODE = 5
+COLUMN_OF = 6
 
-def nettoyer_donnees_brutes(text_input: str) -> pd.DataFrame:
+
+def _bloc_vers_long(infos, data_vals, cote_names, min_tol, aim_tol, max_tol) -> pd.DataFrame:
+    # Passage large -> long en une seule passe : les mesures sont aplaties
+    # ligne par ligne (ordre C), les infos pièce sont répétées pour chaque cote
+    # et les lignes d'en-tête (nominal / tolérances) sont diffusées par np.tile.
+    # infos : tableau (n_pieces, 3) -> Date, Serial, OF
+    n_pieces, n_cotes = data_vals.shape
+
+    return pd.DataFrame({
+        "Date": np.repeat(infos[:, 0], n_cotes),
+        "Serial": np.repeat(infos[:, 1], n_cotes),
+        "OF": np.repeat(infos[:, 2], n_cotes),
+        "Nom_Cote": np.tile(cote_names, n_pieces),
+        "Mesure": data_vals.ravel(),
+        "Nominal": np.tile(aim_tol, n_pieces),
+        "Tolérance_Min": np.tile(min_tol, n_pieces),
+        "Tolérance_Max": np.tile(max_tol, n_pieces),
+    })
+
+
+def format_brut_vers_long(df_raw: pd.DataFrame) -> pd.DataFrame:
+    cote_names = df_raw.iloc[ROW_COTE_NAMES, COLUMN_DATA_START:].to_numpy()
+    min_tol = df_raw.iloc[ROW_MIN, COLUMN_DATA_START:].to_numpy()
+    aim_tol = df_raw.iloc[ROW_AIM, COLUMN_DATA_START:].to_numpy()
+    max_tol = df_raw.iloc[ROW_MAX, COLUMN_DATA_START:].to_numpy()
+
+    infos = df_raw.iloc[ROW_DATA_START:, [COLUMN_DATETIME, COLUMN_SERIAL, COLUMN_OF]].to_numpy()
+    data_vals = df_raw.iloc[ROW_DATA_START:, COLUMN_DATA_START:].to_numpy()
+
+    return _bloc_vers_long(infos, data_vals, cote_names, min_tol, aim_tol, max_tol)
+
+
+def iterer_excel_brut(fichier, taille_bloc: int = 5000):
+    # Lecture en flux (openpyxl read_only) de l'export machine .xlsx :
+    # les lignes d'en-tête sont lues une fois, puis les pièces sont converties
+    # au format long par blocs de `taille_bloc` lignes, sans charger le classeur.
+    from openpyxl import load_workbook
+
+    wb = load_workbook(fichier, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        lignes = ws.iter_rows(values_only=True)
+
+        entetes = {}
+        for i in range(ROW_DATA_START):
+            ligne = next(lignes, None)
+            if ligne is None:
+                raise ValueError("❌ Fichier Excel trop court pour le format brut.")
+            entetes[i] = ligne
+
+        n_colonnes = len(entetes[ROW_COTE_NAMES])
+        cote_names = np.array(entetes[ROW_COTE_NAMES][COLUMN_DATA_START:], dtype=object)
+        min_tol = np.array(entetes[ROW_MIN][COLUMN_DATA_START:n_colonnes], dtype=object)
+        aim_tol = np.array(entetes[ROW_AIM][COLUMN_DATA_START:n_colonnes], dtype=object)
+        max_tol = np.array(entetes[ROW_MAX][COLUMN_DATA_START:n_colonnes], dtype=object)
+
+        # Les colonnes sans nom de cote (fin de tableau) sont ignorées
+        garder = np.array([c is not None for c in cote_names])
+        cote_names, min_tol, aim_tol, max_tol = (a[garder] for a in (cote_names, min_tol, aim_tol, max_tol))
+
+        bloc = []
+        for ligne in lignes:
+            ligne = tuple(ligne) + (None,) * (n_colonnes - len(ligne))
+            if all(v is None for v in ligne[COLUMN_DATA_START:n_colonnes]):
+                continue
+            bloc.append(ligne[:n_colonnes])
+            if len(bloc) >= taille_bloc:
+                yield _bloc_excel_vers_long(bloc, garder, cote_names, min_tol, aim_tol, max_tol)
+                bloc = []
+        if bloc:
+            yield _bloc_excel_vers_long(bloc, garder, cote_names, min_tol, aim_tol, max_tol)
+    finally:
+        wb.close()
+
+
+def _bloc_excel_vers_long(bloc, garder, cote_names, min_tol, aim_tol, max_tol) -> pd.DataFrame:
+    tableau = np.array(bloc, dtype=object)
+    infos = tableau[:, [COLUMN_DATETIME, COLUMN_SERIAL, COLUMN_OF]]
+    data_vals = tableau[:, COLUMN_DATA_START:][:, garder]
+    return _bloc_vers_long(infos, data_vals, cote_names, min_tol, aim_tol, max_tol)
+
+
+def _parser_excel(fichier) -> pd.DataFrame:
+    # fichier : chemin ou objet fichier (lu en flux par openpyxl)
+    if hasattr(fichier, "seek"):
+        fichier.seek(0)
+    blocs = [typer_colonnes(bloc) for bloc in iterer_excel_brut(fichier)]
+    if not blocs:
+        raise ValueError("❌ Aucune mesure trouvée dans le fichier Excel.")
+    invalides = {}
+    for bloc in blocs:
+        for col, n in bloc.attrs["valeurs_invalides"].items():
+            invalides[col] = invalides.get(col, 0) + n
+    df_long = pd.concat(blocs, ignore_index=True)
+    df_long.attrs["valeurs_invalides"] = invalides
+    return df_long
+
+
+# --- Cache d'ingestion partagé entre les pages et les reruns Streamlit ---
+# Clé = empreinte du contenu brut (texte collé ou fichier), valeur = DataFrame
+# long déjà nettoyé et typé. Taille bornée, éviction du moins récemment utilisé.
+TAILLE_MAX_CACHE_INGESTION = 16
+_cache_ingestion = OrderedDict()
+_verrou_cache = threading.Lock()
+
+EXPECTED_COLS = ["Date", "Serial", "OF", "Nom_Cote", "Mesure", "Nominal", "Tolérance_Min", "Tolérance_Max"]
+COLONNES_NUMERIQUES = ["Mesure", "Nominal", "Tolérance_Min", "Tolérance_Max"]
+
+
+TAILLE_LECTURE_EMPREINTE = 1 << 20
+
+
+def empreinte_contenu(contenu) -> str:
+    if isinstance(contenu, str):
+        contenu = contenu.encode("utf-8")
+    return hashlib.sha1(contenu).hexdigest()
+
+
+def empreinte_fichier(fichier) -> str:
+    # Même empreinte que empreinte_contenu, calculée par morceaux (fichier jamais chargé en entier)
+    empreinte = hashlib.sha1()
+    flux = open(fichier, "rb") if isinstance(fichier, (str, os.PathLike)) else fichier
+    try:
+        flux.seek(0)
+        for morceau in iter(lambda: flux.read(TAILLE_LECTURE_EMPREINTE), b""):
+            empreinte.update(morceau)
+    finally:
+        if flux is not fichier:
+            flux.close()
+        else:
+            flux.seek(0)
+    return empreinte.hexdigest()
+
+
+def memoriser_ingestion(cle: str, charger, compact: bool = False):
+    # Le cache conserve la forme compacte (faits + dimension des cotes) ;
+    # les tolérances ne sont rejointes que pour l'appelant.
+    with _verrou_cache:
+        donnees = _cache_ingestion.get(cle)
+        if donnees is not None:
+            _cache_ingestion.move_to_end(cle)
+
+    if donnees is None:
+        donnees = compacter_mesures(charger())
+        donnees[0].attrs["empreinte"] = cle
+        with _verrou_cache:
+            _cache_ingestion[cle] = donnees
+            _cache_ingestion.move_to_end(cle)
+            while len(_cache_ingestion) > TAILLE_MAX_CACHE_INGESTION:
+                _cache_ingestion.popitem(last=False)
+
+    df_mesures, df_cotes = donnees
+    _signaler_valeurs_invalides(df_mesures)
+    if compact:
+        return df_mesures.copy(), df_cotes.copy()
+    return joindre_tolerances(df_mesures, df_cotes)
+
+
+def vider_cache_ingestion():
+    with _verrou_cache:
+        _cache_ingestion.clear()
+
+
+def typer_colonnes(df_long: pd.DataFrame) -> pd.DataFrame:
+    # Conversion numérique (virgule décimale Excel -> point). Les cellules non
+    # vides illisibles deviennent NaN ; leur nombre par colonne est gardé dans
+    # attrs["valeurs_invalides"] pour être signalé à chaque lecture.
+    invalides = {}
+    for col in COLONNES_NUMERIQUES:
+        if not pd.api.types.is_numeric_dtype(df_long[col]):
+            texte = df_long[col].astype(str).str.strip()
+            renseigne = df_long[col].notna().to_numpy() & texte.ne("").to_numpy()
+            df_long[col] = pd.to_numeric(texte.str.replace(",", ".", regex=False), errors="coerce")
+            n = int((df_long[col].isna() & renseigne).sum())
+            if n:
+                invalides[col] = n
+    df_long.attrs["valeurs_invalides"] = invalides
+    return df_long
+
+
+def _signaler_valeurs_invalides(df: pd.DataFrame):
+    invalides = df.attrs.get("valeurs_invalides") or {}
+    if invalides:
+        detail = ", ".join(f"{col} : {n}" for col, n in invalides.items())
+        st.warning(f"⚠️ {sum(invalides.values())} valeur(s) non numérique(s) ignorée(s) ({detail}).")
+
+
+def _parser_texte(text_input: str) -> pd.DataFrame:
     df_temp = pd.read_csv(StringIO(text_input), sep="\t", header=None)
 
     # --- Format brut ou structuré ?
     if df_temp.shape[0] > 12 and df_temp.shape[1] > 10 and "FCollAvg" not in df_temp.columns:
         # === Format BRUT détecté ===
-        row_data_start = 10
-        column_data_start = 7
-        row_cote_names = 2
-        row_min = 5
-        row_aim = 6
-        row_max = 7
-        column_datetime = 0
-        column_serial = 1
-        column_platcode = 5
-        column_of = 6
-
-        cote_names = df_temp.iloc[row_cote_names, column_data_start:].values
-        min_tol = df_temp.iloc[row_min, column_data_start:].values
-        aim_tol = df_temp.iloc[row_aim, column_data_start:].values
-        max_tol = df_temp.iloc[row_max, column_data_start:].values
-
-        data_vals = df_temp.iloc[row_data_start:, column_data_start:]
-        data_vals.columns = cote_names
-
-        info_cols_sorted = df_temp.iloc[row_data_start:, [column_datetime, column_serial, column_platcode, column_of]].rename(
-            columns={column_datetime: "datetime", column_serial: "serial", column_platcode: "plantcode", column_of: "OF"}
-        )
-
-        records = []
-        for idx, row in data_vals.iterrows():
-            info = info_cols_sorted.iloc[idx - row_data_start]
-            for i, val in enumerate(row):
-                records.append({
-                    "Date": info["datetime"],
-                    "Serial": info["serial"],
-                    "OF": info["OF"],
-                    "Nom_Cote": cote_names[i],
-                    "Mesure": val,
-                    "Nominal": aim_tol[i],
-                    "Tolérance_Min": min_tol[i],
-                    "Tolérance_Max": max_tol[i]
-                })
-
-        df_long = pd.DataFrame(records)
+        df_long = format_brut_vers_long(df_temp)
 
     else:
         # === Format STRUCTURÉ ===
@@ -125,31 +276,50 @@ def nettoyer_donnees_brutes(text_input: str) -> pd.DataFrame:
         df_long.columns = df_long.columns.str.strip()
 
     # === Validation colonnes attendues ===
-    expected_cols = ["Date", "Serial", "OF", "Nom_Cote", "Mesure", "Nominal", "Tolérance_Min", "Tolérance_Max"]
-    if not all(col in df_long.columns for col in expected_cols):
-        raise ValueError(f"❌ Colonnes attendues : {expected_cols}. Colonnes détectées : {df_long.columns.tolist()}")
+    if not all(col in df_long.columns for col in EXPECTED_COLS):
+        raise ValueError(f"❌ Colonnes attendues : {EXPECTED_COLS}. Colonnes détectées : {df_long.columns.tolist()}")
 
+    return typer_colonnes(df_long)
+
+
+def lire_donnees_collees(text_input: str, compact: bool = False):
+    # Lecture (format BRUT ou structuré) mise en cache sur le contenu collé.
+    # compact=True -> (df_mesures, df_cotes), cf. modules.format_compact
+    return memoriser_ingestion(empreinte_contenu(text_input), lambda: _parser_texte(text_input), compact)
+
+
+def lire_fichier_excel(fichier, compact: bool = False):
+    # Export machine .xlsx (fichier chemin ou UploadedFile Streamlit), mis en cache sur son
+    # contenu : empreinte par morceaux puis lecture en flux, sans copie complète en mémoire
+    return memoriser_ingestion(empreinte_fichier(fichier), lambda: _parser_excel(fichier), compact)
+
+
+def nettoyer_donnees_brutes(text_input: str) -> pd.DataFrame:
+    return enrichir_cotes_info(lire_donnees_collees(text_input))
+
+
+def nettoyer_fichier_excel(fichier) -> pd.DataFrame:
+    return enrichir_cotes_info(lire_fichier_excel(fichier))
+
+
+def enrichir_cotes_info(df_long: pd.DataFrame) -> pd.DataFrame:
     # === Gestion de cotes_info global ===
     if "cotes_info" not in st.session_state:
         st.session_state.cotes_info = {}
 
     unique_cotes = df_long["Nom_Cote"].dropna().unique().tolist()
+    a_indexer = [c for c in unique_cotes if "Position_Angulaire" not in st.session_state.cotes_info.get(c, {})]
     for cote in unique_cotes:
         if cote not in st.session_state.cotes_info:
             st.session_state.cotes_info[cote] = {
-                "Type_Cote": detect_type(cote),
+                "Type_Cote": detecter_type(cote),
                 "Tolérances_GPS": [],
                 "Groupe_Profil": None,
                 "Position_Angulaire": "Non spécifié",
                 "Angle_Degres": None
             }
+    # Angles et groupes de profil déduits des noms (ANGx)
+    completer_cotes_info(st.session_state.cotes_info, unique_cotes, a_indexer)
 
-    # Ajout des colonnes supplémentaires au DataFrame
-    df_long["Angle_Degres"] = df_long["Nom_Cote"].map(
-        lambda x: st.session_state.cotes_info.get(x, {}).get("Angle_Degres", None)
-    )
-    df_long["Type_Cote"] = df_long["Nom_Cote"].map(
-        lambda x: st.session_state.cotes_info.get(x, {}).get("Type_Cote", detect_type(x))
-    )
-
-    return df_long
+    # Colonnes de métadonnées (type, angle, groupe de profil, position, hauteur)
+    return enrichir_mesures(df_long, st.session_state.cotes_info)
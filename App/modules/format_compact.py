@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+# --- Représentation compacte du format long ---
+# Table de faits : une ligne par mesure, chaînes répétées en catégories,
+# mesures en float32 quand la résolution le permet, et un code "Ref_Cote"
+# vers la table de dimension des cotes (Nom_Cote, Nominal, tolérances).
+# Le float32 ne sert qu'au stockage : joindre_tolerances restitue des float64
+# identiques aux valeurs lues (arrondi au nombre de décimales mémorisé pour
+# chaque colonne).
+
+COLONNES_TOLERANCES = ["Nominal", "Tolérance_Min", "Tolérance_Max"]
+COLONNES_CATEGORIELLES = ["Serial", "OF", "Nom_Cote", "Type_Cote"]
+
+COLONNES_FLOTTANTES = ["Mesure"] + COLONNES_TOLERANCES
+DECIMALES_MAX = 6
+
+
+def decimales_float32(valeurs):
+    # Plus petit nombre de décimales d tel que float32 -> float64 -> arrondi à d
+    # restitue exactement les valeurs ; None si le float32 perdrait de l'information
+    valeurs = np.asarray(valeurs, dtype=np.float64)
+    valeurs = valeurs[np.isfinite(valeurs)]
+    retour = valeurs.astype(np.float32).astype(np.float64)
+    for d in range(DECIMALES_MAX + 1):
+        if np.array_equal(np.round(retour, d), valeurs):
+            return d
+    return None
+
+
+def compacter_mesures(df_long: pd.DataFrame):
+    # Retourne (df_mesures, df_cotes) ; df_cotes est indexée par Ref_Cote.
+    # La clé de dimension est le quadruplet (Nom_Cote, Nominal, Tol_Min, Tol_Max) :
+    # une cote dont la tolérance change d'un OF à l'autre reste exacte.
+    cles = ["Nom_Cote"] + COLONNES_TOLERANCES
+    ref_cote, df_cotes = _codes_dimension(df_long, cles)
+
+    decimales = [decimales_float32(df_long[c]) for c in COLONNES_FLOTTANTES]
+    dtype = np.float64 if None in decimales else np.float32
+
+    df_mesures = pd.DataFrame(index=pd.RangeIndex(len(df_long)))
+    for col in df_long.columns:
+        if col in COLONNES_TOLERANCES:
+            continue
+        serie = df_long[col].reset_index(drop=True)
+        if col == "Mesure":
+            serie = serie.astype(dtype)
+        elif col == "Date":
+            serie = _compacter_dates(serie)
+        elif col in COLONNES_CATEGORIELLES:
+            serie = serie.astype("category")
+        df_mesures[col] = serie
+    df_mesures["Ref_Cote"] = ref_cote
+    df_mesures.attrs.update(df_long.attrs)
+    df_mesures.attrs["decimales"] = dict(zip(COLONNES_FLOTTANTES, decimales)) if dtype == np.float32 else None
+
+    df_cotes[COLONNES_TOLERANCES] = df_cotes[COLONNES_TOLERANCES].astype(dtype)
+    df_cotes["Nom_Cote"] = df_cotes["Nom_Cote"].astype(df_mesures["Nom_Cote"].dtype)
+    return df_mesures, df_cotes
+
+
+def _compacter_dates(serie: pd.Series) -> pd.Series:
+    # datetime64 (8 octets) si toutes les dates se lisent, sinon catégories
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    try:
+        return lire_dates(serie)
+    except (ValueError, TypeError):
+        return serie.astype("category")
+
+
+def lire_dates(serie: pd.Series) -> pd.Series:
+    # ISO (aaaa-mm-jj, exports machine) lu tel quel ; sinon dates françaises jj/mm/aaaa.
+    # dayfirst=True ne doit pas s'appliquer à l'ISO (2025-05-10 deviendrait le 5 octobre).
+    texte = serie.dropna().astype(str).str.strip()
+    if texte.str.match(r"^\d{4}-\d{2}-\d{2}").all():
+        return pd.to_datetime(serie, format="ISO8601")
+    try:
+        return pd.to_datetime(serie, dayfirst=True)
+    except ValueError:
+        # Formats mêlés (avec / sans heure) : lecture élément par élément
+        return pd.to_datetime(serie, dayfirst=True, format="mixed")
+
+
+def _codes_dimension(df_long, cles):
+    # Numérotation dans l'ordre d'apparition (NaN compris), cohérente avec drop_duplicates
+    codes = df_long.groupby(cles, sort=False, dropna=False, observed=True).ngroup().to_numpy()
+    df_cotes = df_long[cles].drop_duplicates().reset_index(drop=True)
+    df_cotes.index.name = "Ref_Cote"
+    dtype_code = np.int16 if len(df_cotes) < np.iinfo(np.int16).max else np.int32
+    return codes.astype(dtype_code), df_cotes
+
+
+def joindre_tolerances(df_mesures: pd.DataFrame, df_cotes: pd.DataFrame, colonnes=None) -> pd.DataFrame:
+    # Jointure à la demande : simple indexation des tableaux de la dimension
+    # par les codes Ref_Cote (pas de hash join).
+    colonnes = COLONNES_TOLERANCES if colonnes is None else colonnes
+    codes = df_mesures["Ref_Cote"].to_numpy()
+    decimales = df_mesures.attrs.get("decimales") or {}
+    df = df_mesures.drop(columns="Ref_Cote")
+    if "Mesure" in df.columns:
+        df["Mesure"] = _en_float64(df["Mesure"].to_numpy(), decimales.get("Mesure"))
+    position = df.columns.get_loc("Mesure") + 1 if "Mesure" in df.columns else len(df.columns)
+    for i, col in enumerate(colonnes):
+        valeurs = df_cotes[col].to_numpy()
+        if col in COLONNES_FLOTTANTES:
+            valeurs = _en_float64(valeurs, decimales.get(col))
+        df.insert(position + i, col, valeurs[codes])
+    return df
+
+
+def _en_float64(valeurs, decimales):
+    if valeurs.dtype != np.float32:
+        return valeurs
+    return np.round(valeurs.astype(np.float64), decimales if decimales is not None else DECIMALES_MAX)
+
+
+def memoire_mo(*dfs) -> float:
+    return sum(df.memory_usage(deep=True).sum() for df in dfs) / 1e6
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+
+# --- Défauts de forme à partir des rayons mesurés par angle ---
+# Chaque profil (groupe de cotes, section de hauteur et pièce) est un ensemble
+# de points (θ, r, z). Le modèle linéarisé classique en métrologie des formes
+# r(θ) ≈ R + a·cosθ + b·sinθ (+ z·(c·cosθ + d·sinθ) pour l'axe incliné d'un cylindre)
+# est ajusté par moindres carrés pour tous les profils en une seule résolution
+# batchée (équations normales empilées, np.linalg.solve sur un tableau 3D).
+# La circularité « zone minimale » part du centre des moindres carrés : la
+# largeur de zone (convexe en a, b) est lissée par log-somme-exp et minimisée
+# par pas de Newton 2x2 batchés, à température décroissante. Le résultat est
+# toujours ≤ à la circularité LSQ.
+
+N_PALIERS_ZONE_MIN = 15
+
+
+def _profils_remplis(cles: pd.DataFrame, colonnes: list):
+    # Tableaux [profil, point] complétés par NaN (profils de tailles différentes) ;
+    # une clé manquante (nominal illisible) forme un profil comme une autre
+    groupes = cles.groupby(list(cles.columns), sort=True, dropna=False)
+    code = groupes.ngroup().to_numpy()
+    uniques = pd.MultiIndex.from_frame(groupes.size().index.to_frame(index=False))
+    ordre = np.argsort(code, kind="stable")
+    code = code[ordre]
+    taille = np.bincount(code, minlength=len(uniques))
+    debut = np.r_[0, np.cumsum(taille)[:-1]]
+    rang = np.arange(len(code)) - debut[code]
+    remplis = []
+    for valeurs in colonnes:
+        t = np.full((len(uniques), max(taille.max(initial=0), 1)), np.nan)
+        t[code, rang] = np.asarray(valeurs, dtype=float)[ordre]
+        remplis.append(t)
+    return uniques, taille, remplis
+
+
+def _moindres_carres(r, colonnes_x):
+    # Résolution batchée ; les points absents (NaN) ont un poids nul
+    masque = ~np.isnan(r)
+    X = np.stack([np.where(masque, c, 0.0) for c in colonnes_x], axis=-1)
+    y = np.where(masque, r, 0.0)
+    XtX = np.einsum("pnk,pnl->pkl", X, X)
+    Xty = np.einsum("pnk,pn->pk", X, y)
+    solvable = np.linalg.matrix_rank(XtX) == XtX.shape[-1]
+    beta = np.full(Xty.shape, np.nan)
+    if solvable.any():
+        beta[solvable] = np.linalg.solve(XtX[solvable], Xty[solvable][..., None])[..., 0]
+    residus = np.where(masque, r - np.einsum("pnk,pk->pn", X, beta), np.nan)
+    return beta, residus
+
+
+def _largeur(residus):
+    # Étendue des résidus par profil (NaN pour un profil sans solution)
+    valides = ~np.isnan(residus)
+    haut = np.where(valides, residus, -np.inf).max(axis=1)
+    bas = np.where(valides, residus, np.inf).min(axis=1)
+    return np.where(valides.any(axis=1), haut - bas, np.nan)
+
+
+def _log_somme_exp(x, T):
+    m = x.max(axis=-1, keepdims=True)
+    poids = np.exp((x - m) / T)
+    somme = poids.sum(axis=-1, keepdims=True)
+    return (m + T * np.log(somme))[..., 0], poids / somme
+
+
+def _zone_minimale(theta, residus, largeur_lsq):
+    # Largeur de zone minimale, tous profils en parallèle. On minimise en (a, b)
+    # max(e) - min(e), e = résidus - a·cosθ - b·sinθ, lissé par log-somme-exp à
+    # température décroissante (pas de Newton 2x2 batchés, avec retour arrière).
+    # Les points absents sont remplacés par le premier point du profil (sans effet sur max / min).
+    absent = np.isnan(residus)
+    theta = np.where(absent, theta[:, :1], theta)
+    residus = np.where(absent, residus[:, :1], residus)
+    cos_t, sin_t = np.cos(theta), np.sin(theta)
+    centre = np.zeros((len(residus), 2))
+
+    def objectif(x, T, lignes=slice(None)):
+        e = residus[lignes] - x[:, 0:1] * cos_t[lignes] - x[:, 1:2] * sin_t[lignes]
+        haut, p_haut = _log_somme_exp(e, T[:, None])
+        bas, p_bas = _log_somme_exp(-e, T[:, None])
+        return haut + bas, p_haut, p_bas
+
+    for T_relatif in np.geomspace(0.1, 1e-5, N_PALIERS_ZONE_MIN):
+        T = np.maximum(largeur_lsq * T_relatif, 1e-12)
+        for _ in range(2):
+            f, p_haut, p_bas = objectif(centre, T)
+            grad = np.zeros_like(centre)
+            hess = np.zeros((len(centre), 2, 2))
+            for p, signe in [(p_haut, -1), (p_bas, 1)]:
+                mc, ms = (p * cos_t).sum(axis=1), (p * sin_t).sum(axis=1)
+                mcc, mss, mcs = (p * cos_t ** 2).sum(axis=1), (p * sin_t ** 2).sum(axis=1), (p * cos_t * sin_t).sum(axis=1)
+                grad += signe * np.column_stack([mc, ms])
+                hess[:, 0, 0] += (mcc - mc * mc) / T
+                hess[:, 1, 1] += (mss - ms * ms) / T
+                hess[:, 0, 1] += (mcs - mc * ms) / T
+            hess[:, 1, 0] = hess[:, 0, 1]
+            pas = -np.linalg.solve(hess + 1e-12 * np.eye(2), grad[..., None])[..., 0]
+            # Retour arrière : on divise le pas tant que l'objectif lissé ne diminue pas
+            facteur = np.ones(len(centre))
+            f_essai, _, _ = objectif(centre + pas, T)
+            for _ in range(6):
+                mauvais = ~(f_essai <= f)
+                if not mauvais.any():
+                    break
+                facteur[mauvais] /= 2
+                f_essai[mauvais], _, _ = objectif(centre[mauvais] + facteur[mauvais, None] * pas[mauvais], T[mauvais], mauvais)
+            centre += np.where(f_essai <= f, facteur, 0.0)[:, None] * pas
+
+    e = residus - centre[:, 0:1] * cos_t - centre[:, 1:2] * sin_t
+    return np.minimum(e.max(axis=1) - e.min(axis=1), largeur_lsq)
+
+
+def ecarts_de_forme(df: pd.DataFrame, profil: str = "Profil", piece: str = "Serial",
+                    hauteur: str = "Hauteur") -> pd.DataFrame:
+    # df : une ligne par point, colonnes profil, pièce, Angle_Degres, Mesure (rayon), Nominal, hauteur (optionnelle)
+    d = df.dropna(subset=["Angle_Degres", "Mesure"])
+    if d.empty:
+        return pd.DataFrame()
+    z = d[hauteur].to_numpy(dtype=float) if hauteur in d.columns else np.zeros(len(d))
+    z = np.nan_to_num(z)
+    theta = np.radians(d["Angle_Degres"].to_numpy(dtype=float))
+    r = d["Mesure"].to_numpy(dtype=float)
+    nominal = d["Nominal"].to_numpy(dtype=float)
+    cles = pd.DataFrame({
+        "Profil": d[profil].astype(str).to_numpy(),
+        "Nominal": nominal,
+        "Hauteur": z,
+        "Pièce": d[piece].astype(str).to_numpy() if piece in d.columns else "",
+    })
+
+    # Sections (profil, nominal, hauteur, pièce) : rayon LSQ, excentricité, circularité.
+    # Le modèle a 3 paramètres (R, a, b) : avec 3 points il passe par tous les points
+    # (résidus nuls), la circularité n'est évaluable qu'à partir de 4 points.
+    sections, n_points, (t, rr) = _profils_remplis(cles, [theta, r])
+    beta, residus = _moindres_carres(rr, [np.ones_like(t), np.cos(t), np.sin(t)])
+    circ_lsq = _largeur(residus)
+    circ_mz = _zone_minimale(t, residus, np.nan_to_num(circ_lsq))
+    res = pd.DataFrame({
+        "Profil": sections.get_level_values("Profil"),
+        "Nominal": sections.get_level_values("Nominal"),
+        "Hauteur": sections.get_level_values("Hauteur"),
+        "Pièce": sections.get_level_values("Pièce"),
+        "N Points": n_points,
+        "Rayon LSQ": beta[:, 0],
+        "Excentricité": np.hypot(beta[:, 1], beta[:, 2]),
+        "Circularité LSQ": np.where(n_points >= 4, circ_lsq, np.nan),
+        "Circularité MZ": np.where(n_points >= 4, circ_mz, np.nan),
+    })
+
+    # Cylindricité (profil, nominal, pièce) : au moins deux hauteurs, modèle à axe incliné
+    cylindres, n_cyl, (t, rr, zz) = _profils_remplis(cles[["Profil", "Nominal", "Pièce"]], [theta, r, z])
+    _, residus = _moindres_carres(rr, [np.ones_like(t), np.cos(t), np.sin(t), zz * np.cos(t), zz * np.sin(t)])
+    n_hauteurs = np.sum(np.diff(np.sort(zz, axis=1), axis=1) > 0, axis=1) + 1
+    cyl = pd.DataFrame({
+        "Profil": cylindres.get_level_values("Profil"),
+        "Nominal": cylindres.get_level_values("Nominal"),
+        "Pièce": cylindres.get_level_values("Pièce"),
+        "Cylindricité": np.where((n_hauteurs >= 2) & (n_cyl >= 6), _largeur(residus), np.nan),
+    })
+    return res.merge(cyl, on=["Profil", "Nominal", "Pièce"], how="left")
+
+
+def synthese_forme(ecarts: pd.DataFrame) -> pd.DataFrame:
+    # Par profil : pire section et pire pièce
+    return ecarts.groupby(["Profil", "Nominal"], sort=True, dropna=False).agg(
+        N_Pieces=("Pièce", "nunique"),
+        Circ_LSQ_max=("Circularité LSQ", "max"),
+        Circ_MZ_moy=("Circularité MZ", "mean"),
+        Circ_MZ_max=("Circularité MZ", "max"),
+        Exc_max=("Excentricité", "max"),
+        Cyl_max=("Cylindricité", "max"),
+    ).rename(columns={
+        "N_Pieces": "N Pièces", "Circ_LSQ_max": "Circularité LSQ max", "Circ_MZ_moy": "Circularité MZ moyenne",
+        "Circ_MZ_max": "Circularité MZ max", "Exc_max": "Excentricité max", "Cyl_max": "Cylindricité max",
+    }).reset_index()
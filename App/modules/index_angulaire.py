@@ -0,0 +1,79 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# --- Positions angulaires codées dans les noms de cotes ---
+# "Rayon extérieur ANG3" -> cote de base "Rayon extérieur", index 3, angle en
+# degrés. Les motifs sont essayés dans l'ordre sur les noms uniques (une seule
+# passe str.extract par motif). Un motif fournit soit un index (groupe
+# nommé "index", converti avec le pas angulaire), soit directement des degrés
+# (groupe "degres", ex. "Rayon extérieur @45°"). Pas automatique : 360° /
+# nombre de positions de la base.
+
+MOTIFS_ANGLE = [
+    r"^(?P<base>.*?)\s*\bANG\s*(?P<index>\d+)\s*$",
+    r"^(?P<base>.*?)\s*@\s*(?P<degres>\d+(?:[.,]\d+)?)\s*°?\s*$",
+]
+PAS_AUTO = None
+INDEX_ORIGINE = 1  # ANG1 = 0°
+
+
+def indexer_angles(noms, motifs=MOTIFS_ANGLE, pas=PAS_AUTO, origine: int = INDEX_ORIGINE) -> pd.DataFrame:
+    # Table indexée par Nom_Cote (cotes angulaires seulement) :
+    # Cote_Base, Index_Angulaire, Angle_Degres, Position_Angulaire
+    noms = pd.Series(pd.unique(pd.Series(list(noms), dtype=object).dropna()), dtype=object).astype(str)
+    colonnes = ["Cote_Base", "Index_Angulaire", "Angle_Degres", "Position_Angulaire"]
+    parties = []
+    restants = noms
+    for motif in motifs:
+        if restants.empty:
+            break
+        extrait = restants.str.extract(motif, flags=re.IGNORECASE)
+        trouve = extrait["base"].notna()
+        if not trouve.any():
+            continue
+        e = extrait[trouve]
+        index = pd.to_numeric(e["index"], errors="coerce") if "index" in e else pd.Series(np.nan, index=e.index)
+        degres = (pd.to_numeric(e["degres"].str.replace(",", ".", regex=False), errors="coerce")
+                  if "degres" in e else pd.Series(np.nan, index=e.index))
+        parties.append(pd.DataFrame({
+            "Nom_Cote": restants[trouve],
+            "Cote_Base": e["base"].str.strip(),
+            "Index_Angulaire": index,
+            "Angle_Degres": degres,
+            "Position_Angulaire": np.where(index.notna(), "ANG" + index.astype("Int64").astype(str), None),
+        }))
+        restants = restants[~trouve]
+    if not parties:
+        return pd.DataFrame(columns=colonnes, index=pd.Index([], name="Nom_Cote"))
+    table = pd.concat(parties).set_index("Nom_Cote")
+
+    # Index -> degrés : pas fixe, ou 360° / nombre de positions de la même base
+    a_convertir = table["Index_Angulaire"].notna()
+    if a_convertir.any():
+        rang = table["Index_Angulaire"] - origine
+        if pas is None:
+            n_positions = table.loc[a_convertir].groupby("Cote_Base")["Index_Angulaire"].transform("max") - origine + 1
+            pas_cote = 360.0 / n_positions.reindex(table.index)
+        else:
+            pas_cote = float(pas)
+        table["Angle_Degres"] = table["Angle_Degres"].where(~a_convertir, (rang * pas_cote) % 360)
+    return table[colonnes]
+
+
+def completer_cotes_info(cotes_info: dict, noms, cibles=None, **options) -> pd.DataFrame:
+    # Renseigne Angle_Degres, Position_Angulaire et Groupe_Profil (= cote de base)
+    # des cotes angulaires `cibles` (par défaut toutes), sans écraser une valeur
+    # déjà saisie. Le pas automatique est calculé sur l'ensemble des `noms`.
+    table = indexer_angles(noms, **options)
+    lignes = table if cibles is None else table[table.index.isin(list(cibles))]
+    for nom, ligne in zip(lignes.index, lignes.itertuples(index=False)):
+        info = cotes_info.setdefault(nom, {})
+        if info.get("Angle_Degres") is None and pd.notna(ligne.Angle_Degres):
+            info["Angle_Degres"] = float(ligne.Angle_Degres)
+        if info.get("Position_Angulaire") in (None, "Non spécifié") and ligne.Position_Angulaire:
+            info["Position_Angulaire"] = ligne.Position_Angulaire
+        if not info.get("Groupe_Profil"):
+            info["Groupe_Profil"] = ligne.Cote_Base
+    return table
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from modules.stats_incrementales import empreinte_lot
+
+# --- Index (Nom_Cote, Date) pour les requêtes de dérive ---
+# Le DataFrame est trié une seule fois par (cote, date). Une requête
+# cote + plage de dates se résout par deux recherches dichotomiques :
+# searchsorted sur les noms de cotes triés, puis sur les dates de la cote.
+# Le résultat est une tranche contiguë, déjà triée chronologiquement.
+
+FREQUENCES = {"Jour": "D", "Semaine": "W-MON", "OF": "OF"}
+
+
+def construire_index(df: pd.DataFrame) -> dict:
+    d = df.assign(Date=pd.to_datetime(df["Date"]), _cle=df["Nom_Cote"].astype(str))
+    d = d.dropna(subset=["Date"]).sort_values(["_cle", "Date"], kind="stable").reset_index(drop=True)
+
+    noms = d.pop("_cle").to_numpy()
+    debuts = np.flatnonzero(np.r_[True, noms[1:] != noms[:-1]]) if len(noms) else np.array([], dtype=int)
+    return {
+        "df": d,
+        "cotes": noms[debuts],
+        "bornes": np.r_[debuts, len(d)],
+        "dates": d["Date"].to_numpy(dtype="datetime64[ns]"),
+    }
+
+
+def index_session(df: pd.DataFrame) -> dict:
+    # Un seul index par jeu de données et par session (reconstruit si les données changent).
+    # Clé : empreinte calculée à l'ingestion (contenu collé ou sélection de l'historique),
+    # portée par df.attrs ; hachage complet du DataFrame seulement à défaut.
+    empreinte = df.attrs.get("empreinte")
+    cle = (empreinte, len(df)) if empreinte else empreinte_lot(df)
+    cache = st.session_state.get("index_temporel")
+    if cache is None or cache[0] != cle:
+        cache = (cle, construire_index(df))
+        st.session_state.index_temporel = cache
+    return cache[1]
+
+
+def cotes_indexees(index: dict) -> list:
+    return index["cotes"].tolist()
+
+
+def _tranche_cote(index, nom_cote):
+    i = np.searchsorted(index["cotes"], str(nom_cote))
+    if i >= len(index["cotes"]) or index["cotes"][i] != str(nom_cote):
+        return 0, 0
+    return index["bornes"][i], index["bornes"][i + 1]
+
+
+def fenetre(index: dict, nom_cote, debut=None, fin=None) -> pd.DataFrame:
+    # Mesures d'une cote sur [debut, fin] (bornes incluses), triées par date
+    a, b = _tranche_cote(index, nom_cote)
+    dates = index["dates"][a:b]
+    i0 = np.searchsorted(dates, np.datetime64(pd.Timestamp(debut), "ns"), side="left") if debut is not None else 0
+    i1 = np.searchsorted(dates, np.datetime64(pd.Timestamp(fin), "ns"), side="right") if fin is not None else len(dates)
+    return index["df"].iloc[a + i0:a + i1]
+
+
+def bornes_dates(index: dict, nom_cote):
+    a, b = _tranche_cote(index, nom_cote)
+    if a == b:
+        return None, None
+    return pd.Timestamp(index["dates"][a]), pd.Timestamp(index["dates"][b - 1])
+
+
+def agregats_glissants(df_fenetre: pd.DataFrame, frequence: str = "D", n_periodes: int = 1) -> pd.DataFrame:
+    # Moyenne / écart-type / effectif par période (jour, semaine ou OF), puis
+    # cumul exact sur les `n_periodes` dernières périodes (sommes glissantes).
+    x = df_fenetre["Mesure"].astype(float)
+    decalage = x.mean() if len(x) else 0.0  # centrage : évite la perte de précision sur Σx²
+    d = df_fenetre.assign(_x=x - decalage, _x2=(x - decalage) ** 2)
+
+    if frequence == "OF":
+        groupes = d.groupby("OF", sort=False, observed=True)
+        cle = "OF"
+    else:
+        groupes = d.groupby(pd.Grouper(key="Date", freq=frequence))
+        cle = "Date"
+    p = groupes.agg(n=("_x", "count"), s1=("_x", "sum"), s2=("_x2", "sum"), Début=("Date", "min"))
+    p = p[p["n"] > 0]
+
+    r = p[["n", "s1", "s2"]].rolling(n_periodes, min_periods=1).sum()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        moyenne = r["s1"] / r["n"]
+        variance = (r["s2"] - r["n"] * moyenne ** 2) / (r["n"] - 1)
+    res = pd.DataFrame({
+        "Début": p["Début"],
+        "N": r["n"].astype(int),
+        "Moyenne": moyenne + decalage,
+        "Écart-type": np.sqrt(variance.clip(lower=0)).where(r["n"] > 1),
+    }, index=p.index)
+    res.index.name = cle
+    return res.reset_index()
@@ -0,0 +1,283 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import trimesh  # type: ignore
+import plotly.graph_objects as go
+from scipy.spatial import cKDTree
+
+# --- Cache des maillages STL pour la visualisation 3D ---
+# Chaque STL est analysé une seule fois : sommets (float32) et faces (int32)
+# sont écrits en .npy dans un dossier de cache à côté du fichier source, puis
+# relus en mémoire mappée (np.load(mmap_mode="r")), sans copie. Le nom des
+# fichiers de cache contient la date de modification du STL : un STL modifié
+# est réanalysé, les anciens fichiers de cache sont supprimés. Les niveaux de
+# détail simplifiés sont calculés une fois et mis en cache de la même façon.
+
+DOSSIER_CACHE = "_cache_maillage"
+
+# Niveaux de détail (nombre de faces visé) ; None = maillage complet
+NIVEAUX_DETAIL = {
+    "Aperçu (5k faces)": 5_000,
+    "Intermédiaire (50k faces)": 50_000,
+    "Complet": None,
+}
+NIVEAU_DEFAUT = "Aperçu (5k faces)"
+
+# Zones des cotes par maillage : clé = clé de cache du maillage (STL, date, niveau),
+# taille bornée, éviction du moins récemment utilisé
+TAILLE_MAX_REGIONS = 32
+
+_maillages = {}
+_regions = OrderedDict()
+_verrou_maillages = threading.Lock()
+
+
+def _chemins_cache(chemin_stl: str, mtime_ns: int, n_faces=None) -> dict:
+    dossier = os.path.join(os.path.dirname(chemin_stl), DOSSIER_CACHE)
+    base = os.path.join(dossier, f"{os.path.basename(chemin_stl)}.{mtime_ns}")
+    if n_faces is not None:
+        base += f".lod{n_faces}"
+    return {"dossier": dossier, "sommets": base + ".sommets.npy", "faces": base + ".faces.npy"}
+
+
+def _purger_anciens(chemins: dict, chemin_stl: str, mtime_ns: int):
+    # Supprime les caches (tous niveaux) d'anciennes versions du STL
+    prefixe = os.path.basename(chemin_stl) + "."
+    garder = f"{prefixe}{mtime_ns}."
+    for nom in os.listdir(chemins["dossier"]):
+        if nom.startswith(prefixe) and nom.endswith(".npy") and not nom.startswith(garder):
+            try:
+                os.remove(os.path.join(chemins["dossier"], nom))
+            except OSError:
+                pass
+
+
+def _ecrire_cache(chemins: dict, sommets, faces):
+    os.makedirs(chemins["dossier"], exist_ok=True)
+    for cle, tableau in [("sommets", np.asarray(sommets, dtype=np.float32)),
+                         ("faces", np.asarray(faces, dtype=np.int32))]:
+        # Écriture dans un fichier temporaire puis renommage : pas de cache à moitié écrit
+        temporaire = chemins[cle] + ".tmp"
+        with open(temporaire, "wb") as f:
+            np.save(f, tableau)
+        os.replace(temporaire, chemins[cle])
+
+
+def _ouvrir(chemins: dict):
+    return np.load(chemins["sommets"], mmap_mode="r"), np.load(chemins["faces"], mmap_mode="r")
+
+
+def _en_cache(chemins: dict) -> bool:
+    return os.path.exists(chemins["sommets"]) and os.path.exists(chemins["faces"])
+
+
+def _maillage_complet(chemin_stl: str, mtime_ns: int):
+    # Appelé sous le verrou
+    cle = (chemin_stl, mtime_ns, None)
+    if cle not in _maillages:
+        chemins = _chemins_cache(chemin_stl, mtime_ns)
+        if not _en_cache(chemins):
+            mesh = trimesh.load_mesh(chemin_stl)
+            _ecrire_cache(chemins, mesh.vertices, mesh.faces)
+            _purger_anciens(chemins, chemin_stl, mtime_ns)
+        _maillages[cle] = _ouvrir(chemins)
+    return _maillages[cle]
+
+
+def charger_maillage(chemin_stl: str, n_faces=None):
+    # (sommets, faces) en lecture seule ; mêmes objets à chaque rerun tant que le STL ne change pas.
+    # n_faces : nombre de faces visé (version simplifiée), None pour le maillage complet.
+    chemin_stl = os.path.abspath(chemin_stl)
+    mtime_ns = os.stat(chemin_stl).st_mtime_ns
+    cle = (chemin_stl, mtime_ns, n_faces)
+    with _verrou_maillages:
+        if cle in _maillages:
+            return _maillages[cle]
+        for ancienne in [c for c in _maillages if c[0] == chemin_stl and c[1] != mtime_ns]:
+            del _maillages[ancienne]
+            for cle_regions in [c for c in _regions if c[0] == ancienne]:
+                del _regions[cle_regions]
+        if n_faces is None:
+            return _maillage_complet(chemin_stl, mtime_ns)
+        chemins = _chemins_cache(chemin_stl, mtime_ns, n_faces)
+        if not _en_cache(chemins):
+            _ecrire_cache(chemins, *decimer(*_maillage_complet(chemin_stl, mtime_ns), n_faces))
+        _maillages[cle] = _ouvrir(chemins)
+        return _maillages[cle]
+
+
+# --- Simplification par regroupement de sommets (vertex clustering) ---
+# Les sommets sont regroupés sur une grille régulière ; chaque cellule devient
+# un sommet (barycentre), les faces dégénérées et les doublons disparaissent.
+# La finesse de la grille est cherchée par dichotomie pour approcher n_faces.
+def _regrouper(sommets, faces, n_cellules):
+    mini = sommets.min(axis=0)
+    taille = max(float(np.ptp(sommets, axis=0).max()), 1e-12) / n_cellules
+    cellule = np.minimum(np.floor((sommets - mini) / taille).astype(np.int64), n_cellules)
+    cle = (cellule[:, 0] * (n_cellules + 1) + cellule[:, 1]) * (n_cellules + 1) + cellule[:, 2]
+    _, inverse = np.unique(cle, return_inverse=True)
+    inverse = inverse.ravel()
+
+    f = inverse[faces]
+    f = f[(f[:, 0] != f[:, 1]) & (f[:, 1] != f[:, 2]) & (f[:, 0] != f[:, 2])]
+    _, premieres = np.unique(np.sort(f, axis=1), axis=0, return_index=True)
+    f = f[np.sort(premieres)]
+
+    # Barycentre des sommets de chaque cellule, puis renumérotation des sommets utilisés
+    effectif = np.bincount(inverse)
+    centres = np.column_stack([np.bincount(inverse, weights=sommets[:, a]) / effectif for a in range(3)])
+    utilises, f = np.unique(f, return_inverse=True)
+    return centres[utilises], f.reshape(-1, 3)
+
+
+def decimer(sommets, faces, n_faces: int):
+    sommets = np.asarray(sommets, dtype=np.float64)
+    faces = np.asarray(faces)
+    if len(faces) <= n_faces:
+        return sommets, faces
+    bas, haut = 2, 4096
+    meilleur = _regrouper(sommets, faces, bas)
+    while haut - bas > 1:
+        milieu = (bas + haut) // 2
+        essai = _regrouper(sommets, faces, milieu)
+        if len(essai[1]) <= n_faces:
+            bas, meilleur = milieu, essai
+        else:
+            haut = milieu
+    return meilleur
+
+
+# --- Géométrie quantifiée pour le navigateur ---
+# Sommets ramenés sur une grille uint16 (même pas sur les trois axes : les
+# proportions sont conservées avec aspectmode="data"), indices de faces dans
+# le plus petit type entier possible. Plotly transmet ces tableaux en binaire.
+def quantifier(sommets, faces):
+    sommets = np.asarray(sommets, dtype=np.float64)
+    mini = sommets.min(axis=0)
+    pas = max(float(np.ptp(sommets, axis=0).max()), 1e-12) / 65535
+    q = np.rint((sommets - mini) / pas).astype(np.uint16)
+    type_faces = np.uint16 if len(sommets) <= 65536 else np.uint32
+    return q, np.asarray(faces).astype(type_faces), mini, pas
+
+
+def trace_maillage(sommets, faces, ecarts_sommets=None, **kwargs) -> go.Mesh3d:
+    q, f, _, _ = quantifier(sommets, faces)
+    if ecarts_sommets is not None:
+        # Échelle divergente centrée sur 0 (bleu : sous la nominale, rouge : au-dessus)
+        kwargs.pop("color", None)
+        kwargs.update(intensity=np.asarray(ecarts_sommets, dtype=np.float32), colorscale="RdBu_r",
+                      cmid=0, colorbar=dict(title="Écart (mm)"))
+    return go.Mesh3d(x=q[:, 0], y=q[:, 1], z=q[:, 2], i=f[:, 0], j=f[:, 1], k=f[:, 2], **kwargs)
+
+
+# --- Rotation de la caméra animée dans le navigateur ---
+# Les images (frames) ne contiennent que la position de la caméra : le maillage
+# est envoyé une seule fois, la rotation ne sollicite plus le serveur.
+def animer_camera(fig: go.Figure, n_images: int = 72, r: float = 2.5, hauteur: float = 0.8,
+                  duree_ms: int = 60) -> go.Figure:
+    theta = np.linspace(0, 2 * np.pi, n_images, endpoint=False)
+    fig.frames = [
+        go.Frame(name=str(i), layout=dict(scene_camera=dict(eye=dict(x=r * np.cos(t), y=hauteur, z=r * np.sin(t)))))
+        for i, t in enumerate(theta)
+    ]
+    lecture = dict(frame=dict(duration=duree_ms, redraw=True), transition=dict(duration=0),
+                   fromcurrent=True, mode="immediate")
+    fig.update_layout(
+        scene_camera=dict(eye=dict(x=r, y=hauteur, z=0)),
+        updatemenus=[dict(
+            type="buttons", showactive=False, x=0, y=0, xanchor="left", yanchor="bottom",
+            buttons=[
+                dict(label="▶ Rotation", method="animate", args=[None, lecture]),
+                dict(label="⏸ Pause", method="animate",
+                     args=[[None], dict(frame=dict(duration=0, redraw=False), mode="immediate")]),
+            ],
+        )],
+    )
+    return fig
+
+
+# --- Carte des écarts mesure / nominal sur le maillage ---
+# Chaque cote a un point d'ancrage sur la pièce : "Point_3D" dans cotes_info
+# s'il est renseigné, sinon un point de la surface extérieure placé en
+# coordonnées cylindriques (Angle_Degres et Hauteur_Relative). Une cote sans
+# position connue n'a pas d'ancrage (ligne NaN) : aucune zone ne lui est
+# attribuée. Un KD-tree sur les ancrages attribue une fois pour toutes chaque
+# sommet à la cote la plus proche (ou à aucune, au-delà du rayon d'influence).
+# Recolorer pour un autre OF n'est alors qu'une indexation.
+
+RAYON_INFLUENCE = 0.05  # fraction de la diagonale de la boîte englobante
+
+
+def _axe_piece(sommets):
+    # Axe de révolution supposé : la dimension qui se distingue le plus des deux autres
+    etendue = np.ptp(sommets, axis=0)
+    return int(np.argmax([abs(etendue[a] - np.delete(etendue, a).mean()) for a in range(3)]))
+
+
+def ancrages_cotes(sommets, noms_cotes, cotes_info=None) -> np.ndarray:
+    cotes_info = cotes_info or {}
+    sommets = np.asarray(sommets, dtype=np.float64)
+    n = len(noms_cotes)
+    mini, maxi = sommets.min(axis=0), sommets.max(axis=0)
+    centre = (mini + maxi) / 2
+    axe = _axe_piece(sommets)
+    a1, a2 = [a for a in range(3) if a != axe]
+    rayon = np.hypot(sommets[:, a1] - centre[a1], sommets[:, a2] - centre[a2]).max()
+
+    infos = [cotes_info.get(nom) or {} for nom in noms_cotes]
+    angle = np.array([np.nan if i.get("Angle_Degres") is None else i["Angle_Degres"] for i in infos], dtype=float)
+    hauteur = np.array([np.nan if i.get("Hauteur_Relative") is None else i["Hauteur_Relative"] for i in infos], dtype=float)
+
+    points = np.empty((n, 3))
+    points[:, axe] = mini[axe] + hauteur * (maxi[axe] - mini[axe])
+    points[:, a1] = centre[a1] + rayon * np.cos(np.radians(angle))
+    points[:, a2] = centre[a2] + rayon * np.sin(np.radians(angle))
+    # Angle ou hauteur inconnu : la cote reste sans ancrage
+    points[np.isnan(angle) | np.isnan(hauteur)] = np.nan
+    for i, info in enumerate(infos):
+        if info.get("Point_3D") is not None:
+            points[i] = info["Point_3D"]
+    return points
+
+
+def _cle_maillage(sommets):
+    # Clé du cache de maillages pour des sommets issus de charger_maillage ;
+    # à défaut (tableau externe), empreinte du contenu
+    with _verrou_maillages:
+        for cle, (s, _) in _maillages.items():
+            if s is sommets:
+                return cle
+    return hashlib.blake2b(np.ascontiguousarray(sommets).tobytes(), digest_size=16).hexdigest()
+
+
+def regions_cotes(sommets, ancrages, rayon_influence: float = RAYON_INFLUENCE) -> np.ndarray:
+    # Indice de la cote associée à chaque sommet, -1 hors de toute zone (mémorisé)
+    ancrages = np.ascontiguousarray(ancrages, dtype=np.float64)
+    cle = (_cle_maillage(sommets), ancrages.tobytes(), rayon_influence)
+    with _verrou_maillages:
+        if cle in _regions:
+            _regions.move_to_end(cle)
+            return _regions[cle]
+    # Seules les cotes ancrées ont une zone ; les autres restent neutres (-1)
+    places = np.flatnonzero(np.isfinite(ancrages).all(axis=1))
+    regions = np.full(len(sommets), -1, dtype=np.int32)
+    if len(places):
+        diagonale = float(np.linalg.norm(np.ptp(sommets, axis=0)))
+        _, indices = cKDTree(ancrages[places]).query(np.asarray(sommets, dtype=np.float64),
+                                                     distance_upper_bound=rayon_influence * diagonale)
+        trouve = indices < len(places)
+        regions[trouve] = places[indices[trouve]]
+    with _verrou_maillages:
+        _regions[cle] = regions
+        _regions.move_to_end(cle)
+        while len(_regions) > TAILLE_MAX_REGIONS:
+            _regions.popitem(last=False)
+    return regions
+
+
+def intensite_ecarts(regions, ecarts) -> np.ndarray:
+    # Écart par sommet : simple indexation ; 0 (couleur neutre) hors zone ou cote non mesurée
+    valeurs = np.r_[np.nan_to_num(np.asarray(ecarts, dtype=np.float32)), np.float32(0)]
+    return valeurs[regions]
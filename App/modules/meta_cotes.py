@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from modules.types_cotes import types_cotes, FAMILLE_DEFAUT
+
+# --- Métadonnées des cotes (cotes_info) jointes aux mesures ---
+# cotes_info est converti en une table indexée par Nom_Cote (une ligne par
+# cote unique), puis rattaché aux mesures par une seule jointure sur les
+# codes de Nom_Cote : aucune passe ligne à ligne, et toutes les pages
+# obtiennent les mêmes colonnes.
+
+# Colonne du DataFrame -> clé de cotes_info
+COLONNES_META = {
+    "Type_Cote": "Type_Cote",
+    "Angle_Degres": "Angle_Degres",
+    "Groupe_Profil": "Groupe_Profil",
+    "Position_Angulaire": "Position_Angulaire",
+    "Hauteur": "Hauteur_Relative",
+}
+
+
+def table_cotes(noms, cotes_info: dict = None, famille: str = FAMILLE_DEFAUT) -> pd.DataFrame:
+    cotes_info = cotes_info or {}
+    noms = pd.Index(pd.unique(pd.Series(list(noms), dtype=object).dropna()), name="Nom_Cote")
+    infos = [cotes_info.get(nom) or {} for nom in noms]
+    return pd.DataFrame({
+        "Type_Cote": types_cotes(pd.Series(noms), famille, cotes_info).values,
+        "Angle_Degres": pd.to_numeric(pd.Series([i.get("Angle_Degres") for i in infos], dtype=object), errors="coerce").to_numpy(),
+        "Groupe_Profil": pd.Series([i.get("Groupe_Profil") for i in infos], dtype=object).to_numpy(),
+        "Position_Angulaire": pd.Series([i.get("Position_Angulaire") for i in infos], dtype=object).to_numpy(),
+        "Hauteur": pd.to_numeric(pd.Series([i.get("Hauteur_Relative") for i in infos], dtype=object), errors="coerce").to_numpy(),
+    }, index=noms)
+
+
+def enrichir_mesures(df: pd.DataFrame, cotes_info: dict = None, famille: str = FAMILLE_DEFAUT) -> pd.DataFrame:
+    # Une hauteur déjà présente dans les mesures est conservée (complétée par cotes_info)
+    if isinstance(df["Nom_Cote"].dtype, pd.CategoricalDtype):
+        codes, uniques = df["Nom_Cote"].cat.codes.to_numpy(), df["Nom_Cote"].cat.categories
+    else:
+        codes, uniques = pd.factorize(df["Nom_Cote"])
+    table = table_cotes(uniques, cotes_info, famille)
+
+    # Jointure : chaque ligne reprend la ligne de sa cote ; le code -1 (nom manquant)
+    # pointe vers une ligne vide ajoutée en fin de table
+    table = table.reindex(table.index.append(pd.Index([None])))
+    meta = table.iloc[np.where(codes >= 0, codes, len(table) - 1)].reset_index(drop=True)
+
+    if "Hauteur" in df.columns:
+        meta["Hauteur"] = df["Hauteur"].fillna(pd.Series(meta["Hauteur"].to_numpy(), index=df.index)).to_numpy()
+    elif meta["Hauteur"].isna().all():
+        meta = meta.drop(columns="Hauteur")
+    return df.assign(**{c: meta[c].values for c in meta.columns})
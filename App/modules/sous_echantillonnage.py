@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+# --- Sous-échantillonnage côté serveur des séries longues avant tracé ---
+# LTTB (Largest-Triangle-Three-Buckets) garde la forme visuelle de la courbe ;
+# min-max garde les extrêmes de chaque classe. Dans les deux cas, les points
+# hors tolérance sont toujours conservés. Le sous-échantillonnage s'applique
+# à la fenêtre affichée : réduire la période donne automatiquement plus de détail.
+
+N_POINTS_MAX = 2000
+
+
+def _en_nombres(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64).astype(float)
+    try:
+        return x.astype(float)
+    except (TypeError, ValueError):
+        # Abscisse non numérique (libellés) : on échantillonne sur le rang
+        return np.arange(len(x), dtype=float)
+
+
+def lttb(x, y, n_cible: int) -> np.ndarray:
+    # Indices retenus (x supposé trié). Une itération par classe, vectorisée dans la classe.
+    x = _en_nombres(x)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_cible >= n or n_cible < 3:
+        return np.arange(n)
+
+    bornes = np.linspace(1, n - 1, n_cible - 1).astype(int)
+    retenus = np.empty(n_cible, dtype=int)
+    retenus[0], retenus[-1] = 0, n - 1
+    a = 0
+    for i in range(n_cible - 2):
+        debut, fin = bornes[i], bornes[i + 1]
+        # Point moyen de la classe suivante (le dernier point pour la dernière classe)
+        suiv_fin = bornes[i + 2] if i + 2 < len(bornes) else n
+        moy_x = x[fin:suiv_fin].mean() if suiv_fin > fin else x[-1]
+        moy_y = np.nanmean(y[fin:suiv_fin]) if suiv_fin > fin else y[-1]
+        aire = np.abs((x[a] - moy_x) * (y[debut:fin] - y[a]) - (x[a] - x[debut:fin]) * (moy_y - y[a]))
+        a = debut + int(np.nanargmax(aire)) if np.isfinite(aire).any() else debut
+        retenus[i + 1] = a
+    return retenus
+
+
+def minmax(x, y, n_cible: int) -> np.ndarray:
+    # Indices du min et du max de chaque classe (n_cible / 2 classes), sans boucle
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n_cible >= n:
+        return np.arange(n)
+    n_classes = max(n_cible // 2, 1)
+    debuts = np.linspace(0, n, n_classes + 1).astype(int)[:-1]
+    classe = np.repeat(np.arange(n_classes), np.diff(np.r_[debuts, n]))
+    ordre = np.lexsort((np.nan_to_num(y, nan=np.inf), classe))
+    i_min = ordre[debuts]
+    ordre = np.lexsort((np.nan_to_num(-y, nan=np.inf), classe))
+    i_max = ordre[debuts]
+    return np.unique(np.r_[0, i_min, i_max, n - 1])
+
+
+def sous_echantillonner(df: pd.DataFrame, x: str, y: str, n_max: int = N_POINTS_MAX,
+                        methode: str = "lttb", garder=None) -> pd.DataFrame:
+    # `garder` : masque booléen des points à conserver quoi qu'il arrive (hors tolérance)
+    if len(df) <= n_max:
+        return df
+    if garder is not None:
+        garder = np.asarray(garder, dtype=bool)
+    if not df[x].is_monotonic_increasing:
+        ordre = np.argsort(df[x].to_numpy(), kind="stable")
+        df = df.iloc[ordre]
+        if garder is not None:
+            garder = garder[ordre]
+    fonction = minmax if methode == "minmax" else lttb
+    indices = fonction(df[x].to_numpy(), df[y].to_numpy(), n_max)
+    if garder is not None:
+        indices = np.union1d(indices, np.flatnonzero(garder))
+    return df.iloc[indices]
+
+
+def masque_hors_tolerance(df: pd.DataFrame) -> pd.Series:
+    return (df["Mesure"] < df["Tolérance_Min"]) | (df["Mesure"] > df["Tolérance_Max"])
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from modules.data_cleaning import empreinte_contenu
+
+# --- Accumulateurs SPC fusionnables ---
+# Un accumulateur est un DataFrame indexé par (Nom_Cote, OF) contenant, pour
+# chaque groupe : effectif, moyenne, M2 (somme des carrés des écarts, tirée de
+# la variance groupée du lot), min, max, nombre de hors tolérance et un
+# histogramme à classes fixes. Les clés sont des chaînes : un OF lu comme
+# entier (texte collé) ou comme texte (historique) tombe dans le même groupe ;
+# les noms de cotes sont des identifiants, seulement débarrassés des espaces.
+# Les classes sont définies relativement à l'intervalle de tolérance, donc
+# identiques d'un lot à l'autre : deux accumulateurs se fusionnent exactement
+# (formule de Chan pour la variance, sommes pour le reste).
+
+CLES_ACCUMULATEUR = ["Nom_Cote", "OF"]
+CLES_NUMERIQUES = {"OF"}  # clés dont 9009.0 et 9009 désignent la même valeur
+N_CLASSES = 40
+# Position normalisée u = (x - Tol_Min) / (Tol_Max - Tol_Min), histogramme sur [-0.5, 1.5]
+U_MIN, U_MAX = -0.5, 1.5
+COLONNES_HISTO = [f"H{i:02d}" for i in range(N_CLASSES + 2)]  # + classes de débordement
+
+
+def accumuler_lot(df: pd.DataFrame, par=CLES_ACCUMULATEUR) -> pd.DataFrame:
+    # Coût O(taille du lot) : une agrégation groupée + un bincount pour les histogrammes
+    par = list(par)
+    d = df.dropna(subset=["Mesure"])
+    if d.empty:
+        return _accumulateur_vide(par)
+    d = d.assign(**{c: _cle_texte(d[c], c in CLES_NUMERIQUES) for c in par})
+    x = d["Mesure"].to_numpy(dtype=float)
+    lsl = d["Tolérance_Min"].to_numpy(dtype=float)
+    usl = d["Tolérance_Max"].to_numpy(dtype=float)
+
+    d = d.assign(
+        _x=x,
+        _hors_tol=(x < lsl) | (x > usl),
+    )
+    groupes = d.groupby(par, sort=True, observed=True)
+    acc = groupes.agg(
+        n=("_x", "count"),
+        moyenne=("_x", "mean"),
+        variance=("_x", "var"),
+        min=("_x", "min"),
+        max=("_x", "max"),
+        n_hors_tol=("_hors_tol", "sum"),
+        Nominal=("Nominal", "first"),
+        Tol_Min=("Tolérance_Min", "first"),
+        Tol_Max=("Tolérance_Max", "first"),
+    )
+    acc["m2"] = acc.pop("variance").fillna(0.0) * (acc["n"] - 1)
+
+    # Histogramme : classe de chaque mesure puis comptage (groupe, classe)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        u = (x - lsl) / (usl - lsl)
+    classe = np.floor((u - U_MIN) / (U_MAX - U_MIN) * N_CLASSES).astype(float) + 1
+    classe = np.nan_to_num(classe, nan=0)
+    classe = np.clip(classe, 0, N_CLASSES + 1).astype(int)
+    code = groupes.ngroup().to_numpy()
+    histo = np.bincount(code * (N_CLASSES + 2) + classe, minlength=len(acc) * (N_CLASSES + 2))
+    acc[COLONNES_HISTO] = histo.reshape(len(acc), N_CLASSES + 2)
+    return acc
+
+
+def _cle_texte(serie: pd.Series, numerique: bool = False) -> pd.Series:
+    # Clé numérique : 9009, 9009.0 et "9009" -> "9009"
+    texte = serie.astype(str).str.strip()
+    return texte.str.replace(r"\.0$", "", regex=True) if numerique else texte
+
+
+def _accumulateur_vide(par):
+    colonnes = ["n", "moyenne", "min", "max", "n_hors_tol", "Nominal", "Tol_Min", "Tol_Max", "m2"] + COLONNES_HISTO
+    index = pd.MultiIndex.from_arrays([[] for _ in par], names=par) if len(par) > 1 else pd.Index([], name=par[0])
+    return pd.DataFrame(columns=colonnes, index=index)
+
+
+def agreger_accumulateurs(acc: pd.DataFrame, par=("Nom_Cote",)) -> pd.DataFrame:
+    # Combinaison exacte de groupes partiels (ex. tous les OF d'une cote)
+    par = list(par)
+    acc = acc.reset_index()
+    acc = acc.assign(_somme=acc["n"] * acc["moyenne"])
+    groupes = acc.groupby(par, sort=True, observed=True)
+    res = groupes.agg(
+        n=("n", "sum"),
+        _somme=("_somme", "sum"),
+        min=("min", "min"),
+        max=("max", "max"),
+        n_hors_tol=("n_hors_tol", "sum"),
+        Nominal=("Nominal", "first"),
+        Tol_Min=("Tol_Min", "first"),
+        Tol_Max=("Tol_Max", "first"),
+    )
+    res["moyenne"] = res.pop("_somme") / res["n"]
+    # M2 total = Σ M2_i + Σ n_i (moyenne_i - moyenne)²  (Chan et al.)
+    moyenne_globale = res["moyenne"].reindex(pd.MultiIndex.from_frame(acc[par]) if len(par) > 1 else acc[par[0]]).to_numpy()
+    acc["_m2_part"] = acc["m2"] + acc["n"] * (acc["moyenne"] - moyenne_globale) ** 2
+    res["m2"] = acc.groupby(par, sort=True, observed=True)["_m2_part"].sum()
+    res[COLONNES_HISTO] = groupes[COLONNES_HISTO].sum()
+    return res
+
+
+def fusionner_accumulateurs(acc_a: pd.DataFrame, acc_b: pd.DataFrame) -> pd.DataFrame:
+    if acc_a is None or acc_a.empty:
+        return acc_b
+    if acc_b is None or acc_b.empty:
+        return acc_a
+    par = list(acc_a.index.names)
+    return agreger_accumulateurs(pd.concat([acc_a, acc_b]), par=par)
+
+
+def resumer_accumulateurs(acc: pd.DataFrame) -> pd.DataFrame:
+    n = acc["n"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma = np.sqrt(np.where(n > 1, acc["m2"].to_numpy(dtype=float) / (n - 1), np.nan))
+        mu = acc["moyenne"].to_numpy(dtype=float)
+        lsl = acc["Tol_Min"].to_numpy(dtype=float)
+        usl = acc["Tol_Max"].to_numpy(dtype=float)
+        pp = np.where(sigma > 0, (usl - lsl) / (6 * sigma), np.nan)
+        ppk = np.where(sigma > 0, np.minimum(usl - mu, mu - lsl) / (3 * sigma), np.nan)
+
+    res = pd.DataFrame(index=acc.index)
+    res["N Mesures"] = acc["n"].astype(int)
+    res["Moyenne"] = mu
+    res["Écart-type"] = sigma
+    res["Min"] = acc["min"].astype(float)
+    res["Max"] = acc["max"].astype(float)
+    res["Pp"] = pp
+    res["Ppk"] = ppk
+    res["% hors tolérance"] = 100 * acc["n_hors_tol"].to_numpy(dtype=float) / n
+    return res.reset_index()
+
+
+def histogramme(acc: pd.DataFrame, cle) -> pd.DataFrame:
+    # Classes de l'histogramme d'un groupe, en mm (les débordements sont exclus)
+    ligne = acc.loc[cle]
+    u = np.linspace(U_MIN, U_MAX, N_CLASSES + 1)
+    bords = ligne["Tol_Min"] + u * (ligne["Tol_Max"] - ligne["Tol_Min"])
+    return pd.DataFrame({
+        "Début": bords[:-1],
+        "Fin": bords[1:],
+        "Effectif": ligne[COLONNES_HISTO[1:-1]].to_numpy(dtype=int),
+    })
+
+
+# --- Intégration au suivi de session ---
+def empreinte_lot(df: pd.DataFrame) -> str:
+    colonnes = [c for c in ["Serial", "Nom_Cote", "Date", "Mesure"] if c in df.columns]
+    return empreinte_contenu(pd.util.hash_pandas_object(df[colonnes], index=False).to_numpy().tobytes())
+
+
+def integrer_lot_session(df: pd.DataFrame) -> bool:
+    # Replie le lot dans l'accumulateur de session, une seule fois par lot
+    lots = st.session_state.setdefault("lots_spc_integres", set())
+    cle = empreinte_lot(df)
+    if cle in lots:
+        return False
+    acc_lot = accumuler_lot(df)
+    st.session_state.accumulateurs_spc = fusionner_accumulateurs(
+        st.session_state.get("accumulateurs_spc"), acc_lot
+    )
+    lots.add(cle)
+    return True
+
+
+def reinitialiser_suivi_session():
+    st.session_state.accumulateurs_spc = None
+    st.session_state.lots_spc_integres = set()
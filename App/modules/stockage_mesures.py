@@ -0,0 +1,132 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import streamlit as st
+
+from modules.data_cleaning import EXPECTED_COLS, empreinte_contenu
+
+# --- Historique local des mesures (format long nettoyé) ---
+# Parquet partitionné façon Hive : mesures_store/OF=<of>/Mois=<AAAA-MM>/*.parquet
+DOSSIER_STOCKAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mesures_store")
+CLE_UNICITE = ["Serial", "Nom_Cote", "Date"]
+SANS_DATE = "sans_date"
+
+_partitionnement = ds.partitioning(
+    pa.schema([("OF", pa.string()), ("Mois", pa.string())]), flavor="hive"
+)
+
+
+def _preparer(df_long: pd.DataFrame) -> pd.DataFrame:
+    df = df_long[EXPECTED_COLS].copy()
+    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+    df["OF"] = df["OF"].astype(str)
+    df["Serial"] = df["Serial"].astype(str)
+    df["Nom_Cote"] = df["Nom_Cote"].astype(str)
+    for col in ["Mesure", "Nominal", "Tolérance_Min", "Tolérance_Max"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    df["Mois"] = df["Date"].dt.strftime("%Y-%m").fillna(SANS_DATE)
+    return df
+
+
+def _dataset(dossier):
+    return ds.dataset(dossier, format="parquet", partitioning=_partitionnement)
+
+
+def _filtre(ofs=None, date_debut=None, date_fin=None, cotes=None):
+    # Les filtres sur OF / Mois élaguent les partitions, ceux sur Date / Nom_Cote
+    # sont poussés jusqu'aux statistiques des row groups Parquet.
+    filtre = None
+
+    def et(expr):
+        return expr if filtre is None else filtre & expr
+
+    if ofs:
+        filtre = et(ds.field("OF").isin([str(of) for of in ofs]))
+    if date_debut is not None:
+        date_debut = pd.Timestamp(date_debut)
+        filtre = et(ds.field("Mois") >= date_debut.strftime("%Y-%m"))
+        filtre = et(ds.field("Date") >= date_debut.to_pydatetime())
+    if date_fin is not None:
+        date_fin = pd.Timestamp(date_fin)
+        filtre = et(ds.field("Mois") <= date_fin.strftime("%Y-%m"))
+        filtre = et(ds.field("Date") <= date_fin.to_pydatetime())
+    if cotes:
+        filtre = et(ds.field("Nom_Cote").isin(list(cotes)))
+    return filtre
+
+
+def enregistrer_mesures(df_long: pd.DataFrame, dossier: str = DOSSIER_STOCKAGE) -> int:
+    # Fusionne le lot avec les partitions (OF, Mois) existantes puis les réécrit :
+    # une même pièce / cote / date enregistrée deux fois n'est gardée qu'une fois.
+    df = _preparer(df_long)
+    n_lot = len(df)
+    if df.empty:
+        return 0
+
+    if os.path.isdir(dossier):
+        touchees = df[["OF", "Mois"]].drop_duplicates()
+        filtre = None
+        for of, mois in touchees.itertuples(index=False):
+            expr = (ds.field("OF") == of) & (ds.field("Mois") == mois)
+            filtre = expr if filtre is None else filtre | expr
+        existant = _dataset(dossier).to_table(filter=filtre).to_pandas()
+        if not existant.empty:
+            df = pd.concat([existant[df.columns], df], ignore_index=True)
+            df = df.drop_duplicates(subset=CLE_UNICITE, keep="last")
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    ds.write_dataset(
+        table, dossier, format="parquet",
+        partitioning=_partitionnement,
+        existing_data_behavior="delete_matching",
+        basename_template="part-{i}.parquet",
+    )
+    return n_lot
+
+
+def charger_mesures(ofs=None, date_debut=None, date_fin=None, cotes=None, colonnes=None,
+                    dossier: str = DOSSIER_STOCKAGE) -> pd.DataFrame:
+    if not os.path.isdir(dossier):
+        return pd.DataFrame(columns=colonnes or EXPECTED_COLS)
+
+    colonnes = colonnes or EXPECTED_COLS
+    dataset = _dataset(dossier)
+    table = dataset.to_table(
+        columns=colonnes,
+        filter=_filtre(ofs, date_debut, date_fin, cotes),
+    )
+    df = table.to_pandas()
+    # Empreinte de la sélection (filtres + fichiers et leurs dates de modification),
+    # sans relire les données : sert de clé aux index construits sur ce DataFrame
+    fichiers = sorted((f, os.stat(f).st_mtime_ns) for f in dataset.files)
+    df.attrs["empreinte"] = empreinte_contenu(repr((ofs, date_debut, date_fin, cotes, colonnes, fichiers)))
+    return df
+
+
+def lister_of(dossier: str = DOSSIER_STOCKAGE) -> list:
+    # Lecture des seuls noms de dossiers de partition (aucun fichier ouvert)
+    if not os.path.isdir(dossier):
+        return []
+    return sorted(
+        nom.split("=", 1)[1] for nom in os.listdir(dossier)
+        if nom.startswith("OF=") and os.path.isdir(os.path.join(dossier, nom))
+    )
+
+
+def selectionner_historique(cle: str = "historique"):
+    # Widgets de chargement partiel de l'historique (OF + période)
+    ofs_dispo = lister_of()
+    if not ofs_dispo:
+        st.info("ℹ️ Aucun historique enregistré pour le moment.")
+        return None
+
+    ofs = st.multiselect("OF à charger :", ofs_dispo, default=ofs_dispo[-1:], key=f"{cle}_of")
+    periode = st.date_input("Période (optionnel) :", (), key=f"{cle}_periode")
+    date_debut, date_fin = (periode if isinstance(periode, tuple) and len(periode) == 2 else (None, None))
+    if date_fin is not None:
+        date_fin = pd.Timestamp(date_fin) + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+
+    if not ofs:
+        return None
+    return charger_mesures(ofs=ofs, date_debut=date_debut, date_fin=date_fin)
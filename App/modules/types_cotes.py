@@ -0,0 +1,61 @@
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# --- Type de cote déduit du nom ---
+# Table de règles ordonnée (première expression qui correspond l'emporte),
+# compilée une fois par famille de pièces. Le typage d'une colonne Nom_Cote
+# ne classe que les noms uniques puis diffuse le résultat par les codes
+# catégoriels : le coût ne dépend pas du nombre de lignes.
+
+TYPES_COTES = ["Diamètre extérieur", "Alésage", "Épaisseur", "Rayon", "Longueur", "Angle", "Autre"]
+TYPE_PAR_DEFAUT = "Autre"
+FAMILLE_DEFAUT = "Standard"
+
+REGLES_FAMILLES = {
+    "Standard": [
+        (r"rayon|\br\s?\d", "Rayon"),
+        (r"diam|ø", "Diamètre extérieur"),
+        (r"[ée]pais|patin", "Épaisseur"),
+        (r"largeur|hauteur|gorge|long", "Longueur"),
+        (r"per[çc]age", "Diamètre extérieur"),
+        (r"al[ée]s", "Alésage"),
+        (r"angle", "Angle"),
+    ],
+}
+
+
+@lru_cache(maxsize=None)
+def _regles_compilees(famille: str):
+    regles = REGLES_FAMILLES.get(famille, REGLES_FAMILLES[FAMILLE_DEFAUT])
+    return tuple((re.compile(motif, re.IGNORECASE), type_cote) for motif, type_cote in regles)
+
+
+@lru_cache(maxsize=65536)
+def detecter_type(nom, famille: str = FAMILLE_DEFAUT) -> str:
+    for motif, type_cote in _regles_compilees(famille):
+        if motif.search(str(nom)):
+            return type_cote
+    return TYPE_PAR_DEFAUT
+
+
+def definir_regles(famille: str, regles: list):
+    # Remplace (ou crée) la table d'une famille ; les caches sont invalidés
+    REGLES_FAMILLES[famille] = list(regles)
+    _regles_compilees.cache_clear()
+    detecter_type.cache_clear()
+
+
+def types_cotes(noms: pd.Series, famille: str = FAMILLE_DEFAUT, cotes_info: dict = None) -> pd.Series:
+    # Type_Cote catégoriel ; un Type_Cote saisi dans cotes_info prime sur la règle
+    cotes_info = cotes_info or {}
+    if isinstance(noms.dtype, pd.CategoricalDtype):
+        codes, uniques = noms.cat.codes.to_numpy(), noms.cat.categories
+    else:
+        codes, uniques = pd.factorize(noms)
+    types_uniques = [cotes_info.get(nom, {}).get("Type_Cote") or detecter_type(nom, famille) for nom in uniques]
+    codes_types, categories = pd.factorize(pd.Series(types_uniques, dtype=object))
+    codes = np.where(codes >= 0, codes_types[codes] if len(codes_types) else -1, -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=noms.index, name="Type_Cote")
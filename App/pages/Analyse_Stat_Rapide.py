@@ -2,7 +2,12 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import os
-from io import StringIO
+from modules.data_cleaning import lire_donnees_collees
+from modules.stockage_mesures import selectionner_historique
+from modules.capabilite import calculer_capabilite, FORMAT_CAPABILITE
+from modules.stats_incrementales import (
+    integrer_lot_session, reinitialiser_suivi_session, agreger_accumulateurs, resumer_accumulateurs
+)
 
 
 # Vérifie que le type d’analyse est bien “stat rapide”
@@ -17,91 +22,78 @@ st.title("📏 Dashboard d'Étude Dimensionnelle")
 
 # --- MAIN ---
 st.subheader("📋 Coller les données CSV depuis Excel")
-text_input = st.text_area("Collez ici les données copiées depuis Excel", height=300)
+source = st.radio("Source des données :", ["Coller depuis Excel", "Historique enregistré"], horizontal=True)
+df_historique = None
+if source == "Historique enregistré":
+    df_historique = selectionner_historique("stat_rapide")
+    text_input = ""
+else:
+    text_input = st.text_area("Collez ici les données copiées depuis Excel", height=300)
 
-if text_input:
+if text_input or (df_historique is not None and not df_historique.empty):
     try:
-        df = pd.read_csv(StringIO(text_input), sep="\t")
-
-        # Vérification des colonnes attendues
-        expected_cols = ["Date", "Serial", "OF", "Nom_Cote", "Mesure", "Nominal", "Tolérance_Min", "Tolérance_Max"]
-        if not all(col in df.columns for col in expected_cols):
-            st.error(f"Colonnes attendues : {expected_cols}. Colonnes détectées : {df.columns.tolist()}")
-        else:
-            # Nettoyage des valeurs de mesure (virgule à point si besoin)
-            df["Mesure"] = df["Mesure"].astype(str).str.replace(",", ".").astype(float)
-
-            # Calculs élémentaires
-            df["Écart (mm)"] = df["Nominal"] - df["Mesure"]
-            df["Écart (%)"] = 100 * df["Écart (mm)"] / df["Mesure"]
-            df["Hors tolérance"] = ~df["Nominal"].between(df["Tolérance_Min"], df["Tolérance_Max"])
-
-            # --- Sélection OF ---
-            st.subheader("📊 Données Mesure")
-            selected_of = st.selectbox("Sélectionnez un OF :", df["OF"].astype(str).unique())
-            df_filtered = df[df["OF"].astype(str) == selected_of]
-
-            st.dataframe(df_filtered, use_container_width=True)
-
-            # --- GRAPHIQUES PAR COTE (POPULATION COMPLÈTE) ---
-            st.subheader("📉 Distribution des écarts par cote (toutes pièces)")
-
-            selected_nom_cote = st.selectbox("Sélectionnez un nom de cote :", df["Nom_Cote"].unique())
-            df_graph = df[df["Nom_Cote"] == selected_nom_cote]
-
-            import altair as alt
-            chart = alt.Chart(df_graph).mark_bar().encode(
-                x=alt.X("Écart (mm):Q", bin=alt.Bin(maxbins=30), title="Écart (mm)"),
-                y=alt.Y("count():Q", title="Nombre de pièces"),   
-                tooltip=["count()"]
-            ).properties(
-                width=600,
-                height=400,
-                title=f"Distribution des écarts pour {selected_nom_cote} (toutes pièces)"
-            )
-            st.altair_chart(chart, use_container_width=True)
-            
-            def compute_stats(group):
-                if len(group) < 2:
-                    return pd.Series({
-                        "N Mesures": len(group),
-                        "Moyenne": group["Nominal"].mean(),
-                        "Écart-type": None,
-                        "Écart moyen absolu": group["Écart (mm)"].abs().mean(),
-                        "Cp": None,
-                        "Cpk": None,
-                        "% hors tolérance": 100 * group["Hors tolérance"].mean()
-                    })
+        df = df_historique if df_historique is not None else lire_donnees_collees(text_input)
+
+        # Calculs élémentaires
+        df["Écart (mm)"] = df["Nominal"] - df["Mesure"]
+        df["Écart (%)"] = 100 * df["Écart (mm)"] / df["Mesure"]
+        df["Hors tolérance"] = ~df["Mesure"].between(df["Tolérance_Min"], df["Tolérance_Max"])
+
+        # --- Sélection OF ---
+        st.subheader("📊 Données Mesure")
+        selected_of = st.selectbox("Sélectionnez un OF :", df["OF"].astype(str).unique())
+        df_filtered = df[df["OF"].astype(str) == selected_of]
+
+        st.dataframe(df_filtered, use_container_width=True)
+
+        # --- GRAPHIQUES PAR COTE (POPULATION COMPLÈTE) ---
+        st.subheader("📉 Distribution des écarts par cote (toutes pièces)")
+
+        selected_nom_cote = st.selectbox("Sélectionnez un nom de cote :", df["Nom_Cote"].unique())
+        df_graph = df[df["Nom_Cote"] == selected_nom_cote]
+
+        import altair as alt
+        chart = alt.Chart(df_graph).mark_bar().encode(
+            x=alt.X("Écart (mm):Q", bin=alt.Bin(maxbins=30), title="Écart (mm)"),
+            y=alt.Y("count():Q", title="Nombre de pièces"),   
+            tooltip=["count()"]
+        ).properties(
+            width=600,
+            height=400,
+            title=f"Distribution des écarts pour {selected_nom_cote} (toutes pièces)"
+        )
+        st.altair_chart(chart, use_container_width=True)
+        
+        # --- INDICATEURS DE CAPABILITÉ (agrégation vectorisée) ---
+        st.subheader("📐 Capabilité par cote")
+        niveau = st.radio("Niveau d'agrégation :", ["Par cote", "Par cote et par OF"], horizontal=True)
+        par = ["Nom_Cote"] if niveau == "Par cote" else ["Nom_Cote", "OF"]
+        stats_df = calculer_capabilite(df, par=par)
+
+        st.dataframe(
+            stats_df.style.format(FORMAT_CAPABILITE, na_rep="–"),
+            use_container_width=True
+        )
+
+        # --- SUIVI INCRÉMENTAL (lots successifs) ---
+        st.subheader("🔁 Suivi incrémental des lots")
+        col_a, col_b = st.columns(2)
+        with col_a:
+            if st.button("➕ Ajouter ce lot au suivi"):
+                if integrer_lot_session(df):
+                    st.success("✅ Lot intégré au suivi.")
                 else:
-                    std = group["Nominal"].std()
-                    mean = group["Nominal"].mean()
-                    tol_min = group["Tolérance_Min"].iloc[0]
-                    tol_max = group["Tolérance_Max"].iloc[0]
-                    cp = (tol_max - tol_min) / (6 * std) if std > 0 else None
-                    cpk = min(tol_max - mean, mean - tol_min) / (3 * std) if std > 0 else None
-
-                    return pd.Series({
-                        "N Mesures": int(len(group)),
-                        "Moyenne": mean,
-                        "Écart-type": std,
-                        "Écart moyen absolu": group["Écart (mm)"].abs().mean(),
-                        "Cp": cp,
-                        "Cpk": cpk,
-                        "% hors tolérance": 100 * group["Hors tolérance"].mean()
-                    })
-
-            stats_df = df.groupby("Nom_Cote").apply(compute_stats).reset_index()
+                    st.info("ℹ️ Ce lot est déjà intégré.")
+        with col_b:
+            if st.button("🗑️ Réinitialiser le suivi"):
+                reinitialiser_suivi_session()
 
+        acc = st.session_state.get("accumulateurs_spc")
+        if acc is not None and not acc.empty:
             st.dataframe(
-                stats_df.style.format({
-                    "N Mesures": "{:.0f}",
-                    "Moyenne": "{:.3f}",
-                    "Écart-type": "{:.3f}",
-                    "Écart moyen absolu": "{:.3f}",
-                    "Cp": "{:.2f}",
-                    "Cpk": "{:.2f}",
-                    "% hors tolérance": "{:.1f} %"
-                }),
+                resumer_accumulateurs(agreger_accumulateurs(acc)).style.format(
+                    {**FORMAT_CAPABILITE, "Min": "{:.3f}", "Max": "{:.3f}"}, na_rep="–"
+                ),
                 use_container_width=True
             )
 
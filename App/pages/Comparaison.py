@@ -5,7 +5,11 @@ from PIL import Image
 from streamlit_drawable_canvas import st_canvas
 from io import StringIO
 import altair as alt
-from modules.data_cleaning import nettoyer_donnees_brutes
+from modules.data_cleaning import nettoyer_donnees_brutes, nettoyer_fichier_excel
+from modules.comparaison_cire_metal import (empiler_cire_metal, normaliser_noms_cotes, apparier_cire_metal,
+                                           retraits_par_cote, rapport_comparaison, CLES_APPARIEMENT,
+                                           FORMAT_RAPPORT, MODELES_RETRAIT, ajuster_retrait, tolerances_metal,
+                                           predire_metal, risque_par_piece)
 
 # --- CONFIG ---
 st.set_page_config(page_title="Comparaison", layout="wide")
@@ -39,21 +43,8 @@ if uploaded_json is not None:
     except Exception as e:
         st.sidebar.error(f"Erreur lors du chargement du JSON : {e}")
 
-# --- FONCTION DE PRÉPARATION ---
-def preparer_donnees_comparaison(df_metal, df_cire):
-    df_metal['Nom_Cote_Normalisé'] = df_metal['Nom_Cote']
-    df_cire['Nom_Cote_Normalisé'] = df_cire['Nom_Cote'].str.replace("Cire_", "", regex=False)
-    df_metal['Type'] = 'Métal'
-    df_cire['Type'] = 'Cire'
-    return pd.concat([df_metal, df_cire], ignore_index=True)
-
 def traiter_df_comparaison(df: pd.DataFrame, nom_type="Données"):
     try:
-        expected_cols = ["Date", "Serial", "OF", "Nom_Cote", "Mesure", "Nominal", "Tolérance_Min", "Tolérance_Max"]
-        if not all(col in df.columns for col in expected_cols):
-            st.error(f"🛑 Colonnes attendues pour {nom_type} : {expected_cols}. Colonnes détectées : {df.columns.tolist()}")
-            return None
-
         # ✅ Conversion des colonnes numériques
         for col in ["Mesure", "Nominal", "Tolérance_Min", "Tolérance_Max"]:
             df[col] = df[col].astype(str).str.replace(",", ".").astype(float)
@@ -70,7 +61,7 @@ def traiter_df_comparaison(df: pd.DataFrame, nom_type="Données"):
 # --- FONCTION GRAPHIQUE ---
 def afficher_graphique_comparaison(df_metal, df_cire):
     # Préparation
-    df_comparaison = preparer_donnees_comparaison(df_metal, df_cire)
+    df_comparaison = empiler_cire_metal(df_metal, df_cire)
 
     st.subheader("📉 Distribution des mesures par cote (toutes pièces)")
 
@@ -124,7 +115,7 @@ def afficher_boxplot_comparaison(df_metal, df_cire):
     st.subheader("📦 Boxplot des mesures par cote")
 
     # Préparer les données
-    df_comparaison = preparer_donnees_comparaison(df_metal, df_cire)
+    df_comparaison = empiler_cire_metal(df_metal, df_cire)
 
     selected_nom_cote = st.selectbox(
         "Sélectionnez une cote pour afficher le boxplot :",
@@ -153,6 +144,96 @@ def afficher_boxplot_comparaison(df_metal, df_cire):
         title=f"📦 Boxplot des mesures pour la cote : {selected_nom_cote}"
     ), use_container_width=True)
 
+def afficher_appariement(df_metal, df_cire):
+    st.subheader("🔗 Retrait cire → métal (pièces appariées)")
+
+    cle = st.radio("Apparier cire et métal par :", CLES_APPARIEMENT, horizontal=True, key="cle_appariement")
+    paires = apparier_cire_metal(df_metal, df_cire, cle=cle)
+    if paires.empty:
+        st.warning(f"Aucune paire cire / métal trouvée sur ({cle}, cote).")
+        return
+
+    st.caption(f"{len(paires)} paires sur {paires[cle].nunique()} {cle} et {paires['Nom_Cote_Normalisé'].nunique()} cotes.")
+    st.dataframe(retraits_par_cote(paires).style.format({
+        "Cire (moyenne)": "{:.3f}", "Métal (moyenne)": "{:.3f}",
+        "Décalage moyen": "{:.3f}", "Décalage σ": "{:.3f}",
+        "Facteur métal / cire": "{:.5f}", "Retrait moyen (%)": "{:.3f}", "Retrait σ (%)": "{:.3f}",
+    }, na_rep="–"), use_container_width=True)
+
+    with st.expander("Détail des paires"):
+        st.dataframe(paires, use_container_width=True)
+
+def afficher_rapport_comparaison(df_metal, df_cire):
+    st.subheader("📋 Rapport de comparaison (toutes les cotes)")
+
+    base = st.radio("Comparer :", ["Mesure", "Écart"], horizontal=True, key="base_rapport",
+                    format_func=lambda b: "Mesures brutes" if b == "Mesure" else "Écarts à la nominale")
+    seuil = st.number_input("Seuil d'alerte sur le décalage moyen (mm)", value=0.05, step=0.01, format="%.3f")
+    rapport = rapport_comparaison(df_metal, df_cire, base=base)
+
+    n_alertes = int((rapport["Décalage moyen"].abs() > seuil).sum())
+    if n_alertes:
+        st.warning(f"⚠️ {n_alertes} cote(s) avec un décalage moyen cire / métal supérieur à {seuil:.3f} mm.")
+
+    def surligner(ligne):
+        alerte = abs(ligne["Décalage moyen"]) > seuil
+        return ["background-color: #ffe5e5" if alerte else "" for _ in ligne]
+
+    st.dataframe(rapport.style.apply(surligner, axis=1).format(FORMAT_RAPPORT, na_rep="–"),
+                 use_container_width=True)
+    st.download_button("📥 Export CSV du rapport", rapport.to_csv(index=False).encode(),
+                       file_name="rapport_comparaison_cire_metal.csv")
+
+def afficher_modele_retrait(df_metal, df_cire):
+    st.subheader("🔮 Modèle de retrait et prédiction métal")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        cle = st.radio("Apparier par :", CLES_APPARIEMENT, horizontal=True, key="cle_modele")
+    with col2:
+        modele = st.radio("Modèle :", MODELES_RETRAIT, horizontal=True, key="forme_modele")
+    with col3:
+        granularite = st.radio("Un modèle par :", ["Cote", "Type de cote"], horizontal=True, key="granularite_modele")
+
+    types = None
+    if granularite == "Type de cote" and "Type_Cote" in df_metal.columns:
+        types = (df_metal.assign(Nom_Cote_Normalisé=normaliser_noms_cotes(df_metal["Nom_Cote"]))
+                 .groupby("Nom_Cote_Normalisé")["Type_Cote"].first().astype(str))
+
+    paires = apparier_cire_metal(df_metal, df_cire, cle=cle)
+    if paires.empty:
+        st.warning("Aucune paire cire / métal pour ajuster le modèle.")
+        return
+    parametres = ajuster_retrait(paires, modele=modele, types=types)
+    st.dataframe(parametres.drop(columns=["Sxx", "Modèle"]).style.format({
+        "a": "{:.4f}", "b": "{:.6f}", "Retrait (%)": "{:.3f}", "σ résiduel": "{:.4f}", "R²": "{:.3f}", "x moyen": "{:.3f}",
+    }, na_rep="–"), use_container_width=True)
+
+    # Lot de cire à évaluer : nouveau lot collé, ou un OF des données cire chargées
+    texte_lot = st.text_area("Collez un nouveau lot de cire à évaluer (optionnel)", height=150, key="lot_cire_nouveau")
+    if texte_lot.strip():
+        try:
+            df_lot = nettoyer_donnees_brutes(texte_lot)
+        except Exception as e:
+            st.error(f"Erreur lot cire : {e}")
+            return
+    else:
+        of_lot = st.selectbox("... ou choisissez un OF cire :", df_cire["OF"].unique().tolist(), key="of_lot_cire")
+        df_lot = df_cire[df_cire["OF"] == of_lot]
+
+    predictions = predire_metal(parametres, df_lot, tolerances_metal(df_metal), types=types)
+    seuil_risque = st.slider("Seuil de risque pièce (%)", 1, 100, 50, key="seuil_risque")
+    risques = risque_par_piece(predictions)
+    n_risque = int((risques["P(pièce hors tolérance)"] * 100 >= seuil_risque).sum())
+    if n_risque:
+        st.warning(f"⚠️ {n_risque} pièce(s) avec un risque de hors tolérance métal ≥ {seuil_risque} %.")
+    st.dataframe(risques.style.format({"P max (une cote)": "{:.1%}", "P(pièce hors tolérance)": "{:.1%}"}),
+                 use_container_width=True)
+    with st.expander("Prédiction par cote"):
+        st.dataframe(predictions.style.format({
+            "Métal prévu": "{:.3f}", "σ prévision": "{:.4f}", "P(hors tolérance)": "{:.1%}",
+        }, na_rep="–"), use_container_width=True)
+
 # --- LAYOUT ---
 tab1, tab2 = st.tabs(["📂 Données métal", "🕯️ Données cire"])
 
@@ -160,9 +241,13 @@ df_cire, df_metal = None, None
 
 with tab1:
     texte_metal = st.text_area("Collez ici les données pour Métal copiées depuis Excel", height=300, key="metal")
-    if texte_metal.strip():
+    fichier_metal = st.file_uploader("📂 ... ou importez l'export Excel brut métal (.xlsx)", type="xlsx", key="xlsx_metal")
+    if fichier_metal is not None or texte_metal.strip():
         try:
-            df_metal_base = nettoyer_donnees_brutes(texte_metal)
+            if fichier_metal is not None:
+                df_metal_base = nettoyer_fichier_excel(fichier_metal)
+            else:
+                df_metal_base = nettoyer_donnees_brutes(texte_metal)
             df_metal = traiter_df_comparaison(df_metal_base.copy(), nom_type="Métal")
             st.success("✅ Données métal prêtes !")
             st.dataframe(df_metal, use_container_width=True)
@@ -171,9 +256,13 @@ with tab1:
 
 with tab2:
     texte_cire = st.text_area("Collez ici les données pour Cire copiées depuis Excel", height=300, key="cire")
-    if texte_cire.strip():
+    fichier_cire = st.file_uploader("📂 ... ou importez l'export Excel brut cire (.xlsx)", type="xlsx", key="xlsx_cire")
+    if fichier_cire is not None or texte_cire.strip():
         try:
-            df_cire_base = nettoyer_donnees_brutes(texte_cire)
+            if fichier_cire is not None:
+                df_cire_base = nettoyer_fichier_excel(fichier_cire)
+            else:
+                df_cire_base = nettoyer_donnees_brutes(texte_cire)
             df_cire = traiter_df_comparaison(df_cire_base.copy(), nom_type="Cire")
             st.success("✅ Données cire prêtes !")
             st.dataframe(df_cire, use_container_width=True)
@@ -183,6 +272,9 @@ with tab2:
 if df_metal is not None and df_cire is not None:
     afficher_graphique_comparaison(df_metal, df_cire)
     afficher_boxplot_comparaison(df_metal, df_cire)
+    afficher_appariement(df_metal, df_cire)
+    afficher_rapport_comparaison(df_metal, df_cire)
+    afficher_modele_retrait(df_metal, df_cire)
 
 # --- AFFICHAGE DES COTES LIÉES (GROUPES DE PROFIL) ---
 st.subheader("📐 Profil de forme à partir des mesures réelles (métal & cire)")
@@ -209,19 +301,10 @@ if "groupes_cotes" in st.session_state and "cotes_info" in st.session_state:
             with col2:
                 of_metal_select = st.selectbox("Sélectionnez un OF (métal) :", of_metal_dispo)
 
-            def nettoyer_nom_cote(nom):
-                return str(nom).replace("Cire_", "").replace(".", ",").strip()
-
-            df_cire_sel = df_cire[df_cire["OF"] == of_cire_select].copy()
-            df_metal_sel = df_metal[df_metal["OF"] == of_metal_select].copy()
-
-            df_cire_sel["Nom_Cote_Normalisé"] = df_cire_sel["Nom_Cote"].apply(nettoyer_nom_cote)
-            df_metal_sel["Nom_Cote_Normalisé"] = df_metal_sel["Nom_Cote"].apply(nettoyer_nom_cote)
-
-            df_cire_sel["Type"] = "Cire"
-            df_metal_sel["Type"] = "Métal"
-
-            df_all = pd.concat([df_cire_sel, df_metal_sel], ignore_index=True)
+            # Noms du groupe ramenés à la même clé normalisée que les mesures
+            cotes_rayon = normaliser_noms_cotes(pd.Series(cotes_rayon), df_metal["Nom_Cote"]).tolist()
+            df_all = empiler_cire_metal(df_metal[df_metal["OF"] == of_metal_select],
+                                        df_cire[df_cire["OF"] == of_cire_select], df_metal["Nom_Cote"])
             df_all = df_all[df_all["Nom_Cote_Normalisé"].isin(cotes_rayon)]
             df_all["OF_affiché"] = df_all["Type"] + " – " + df_all["OF"].astype(str)
 
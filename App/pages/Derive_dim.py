@@ -1,7 +1,14 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from io import StringIO
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from modules.data_cleaning import lire_donnees_collees
+from modules.stockage_mesures import selectionner_historique
+from modules.stats_incrementales import integrer_lot_session, resumer_accumulateurs
+from modules.cartes_controle import calculer_cartes, limites_xbar, synthese_alarmes
+from modules.sous_echantillonnage import sous_echantillonner, masque_hors_tolerance
+from modules.index_temporel import index_session, cotes_indexees, fenetre, bornes_dates, agregats_glissants, FREQUENCES
 
 # --- CONFIG ---
 st.set_page_config(page_title="Étude des dérives dimensionnelles", layout="wide")
@@ -9,19 +16,24 @@ st.title("📉 Étude des dérives dimensionnelles (vie série)")
 
 # --- IMPORT DES DONNÉES ---
 st.subheader("📋 Import des données depuis Excel")
-text_input = st.text_area("Collez ici les données copiées depuis Excel (avec tabulations)", height=300)
+source = st.radio("Source des données :", ["Coller depuis Excel", "Historique enregistré"], horizontal=True)
 
-expected_cols = ["Date", "Serial", "OF", "Nom_Cote", "Mesure", "Nominal", "Tolérance_Min", "Tolérance_Max"]
 df = None
 
+if source == "Historique enregistré":
+    df = selectionner_historique("derive")
+    if df is not None and df.empty:
+        st.warning("⚠️ Aucune mesure pour cette sélection.")
+        df = None
+    if df is not None:
+        df["Hors_Tolérance"] = (df["Mesure"] < df["Tolérance_Min"]) | (df["Mesure"] > df["Tolérance_Max"])
+    text_input = ""
+else:
+    text_input = st.text_area("Collez ici les données copiées depuis Excel (avec tabulations)", height=300)
+
 if text_input:
     try:
-        df = pd.read_csv(StringIO(text_input), sep="\t")
-
-        if not all(col in df.columns for col in expected_cols):
-            st.error(f"❌ Colonnes manquantes. Colonnes attendues : {expected_cols}")
-            st.stop()
-
+        df = lire_donnees_collees(text_input)
         df["Date"] = pd.to_datetime(df["Date"])
         df["Hors_Tolérance"] = (df["Mesure"] < df["Tolérance_Min"]) | (df["Mesure"] > df["Tolérance_Max"])
         st.success("✅ Données importées avec succès")
@@ -30,32 +42,114 @@ if text_input:
         st.error(f"❌ Erreur lors de l'import : {e}")
         st.stop()
 
+# --- ALARMES DE DÉRIVE SUR TOUTES LES COTES ---
+if df is not None:
+    st.subheader("🚨 Alarmes de dérive (toutes cotes)")
+    with st.expander("⚙️ Paramètres des cartes"):
+        lambda_ewma = st.slider("λ EWMA", 0.05, 1.0, 0.2, 0.05)
+        h_cusum = st.slider("Seuil CUSUM h (en σ)", 2.0, 10.0, 5.0, 0.5)
+        cible = st.radio("Cible des cartes :", ["moyenne", "nominal"], horizontal=True)
+    cartes = calculer_cartes(df, lambda_ewma=lambda_ewma, h=h_cusum, cible=cible)
+    st.dataframe(synthese_alarmes(cartes), use_container_width=True)
+
 # --- ANALYSE PAR COTE ---
 if df is not None:
     st.subheader("🔍 Analyse par cote")
 
-    nom_cote = st.selectbox("Sélectionnez une cote :", sorted(df["Nom_Cote"].unique()))
-    df_cote = df[df["Nom_Cote"] == nom_cote]
+    # Index (cote, date) trié une fois par jeu de données : les fenêtres sont des tranches
+    index = index_session(df)
+    nom_cote = st.selectbox("Sélectionnez une cote :", cotes_indexees(index))
+    df_cote = fenetre(index, nom_cote)
 
     # --- FILTRE PAR PÉRIODE ---
     st.markdown("### ⏱️ Filtrer par période")
-    min_date, max_date = df_cote["Date"].min(), df_cote["Date"].max()
+    min_date, max_date = bornes_dates(index, nom_cote)
     date_range = st.date_input("Choisissez une plage de dates :", (min_date, max_date))
 
     if isinstance(date_range, tuple) and len(date_range) == 2:
-        df_cote = df_cote[(df_cote["Date"] >= pd.to_datetime(date_range[0])) & 
-                          (df_cote["Date"] <= pd.to_datetime(date_range[1]))]
+        fin_journee = pd.to_datetime(date_range[1]) + pd.Timedelta(days=1) - pd.Timedelta(nanoseconds=1)
+        df_cote = fenetre(index, nom_cote, pd.to_datetime(date_range[0]), fin_journee)
 
     st.markdown("### 📈 Évolution dans le temps")
-    fig = px.line(df_cote.sort_values("Date"), x="Date", y="Mesure", markers=True,
+    # Réduction LTTB sur la période affichée (hors tolérance toujours conservés) :
+    # resserrer la période redonne le détail complet.
+    df_trace = sous_echantillonner(df_cote, "Date", "Mesure", garder=masque_hors_tolerance(df_cote))
+    if len(df_trace) < len(df_cote):
+        st.caption(f"Affichage de {len(df_trace)} points sur {len(df_cote)} (réduisez la période pour plus de détail).")
+    fig = px.line(df_trace, x="Date", y="Mesure", markers=True,
                   title=f"Évolution de la cote '{nom_cote}' dans le temps")
     fig.add_hline(y=df_cote["Nominal"].iloc[0], line_color="green", line_dash="dash", annotation_text="Nominal")
     fig.add_hline(y=df_cote["Tolérance_Min"].iloc[0], line_color="red", line_dash="dot", annotation_text="Tol. Min")
     fig.add_hline(y=df_cote["Tolérance_Max"].iloc[0], line_color="red", line_dash="dot", annotation_text="Tol. Max")
     st.plotly_chart(fig, use_container_width=True)
 
+    st.markdown("### 📊 Agrégats glissants")
+    col_f, col_n = st.columns(2)
+    with col_f:
+        frequence = st.radio("Période :", list(FREQUENCES.keys()), horizontal=True)
+    with col_n:
+        n_periodes = st.number_input("Fenêtre glissante (nombre de périodes) :", min_value=1, value=1, step=1)
+    df_agg = agregats_glissants(df_cote, FREQUENCES[frequence], int(n_periodes))
+    x_agg = "OF" if frequence == "OF" else "Date"
+    if frequence == "OF":
+        df_agg["OF"] = df_agg["OF"].astype(str)
+    fig_agg = px.line(df_agg, x=x_agg, y="Moyenne", error_y="Écart-type", markers=True, hover_data=["N", "Début"],
+                      title=f"Moyenne glissante ({int(n_periodes)} × {frequence.lower()}) pour '{nom_cote}'")
+    st.plotly_chart(fig_agg, use_container_width=True)
+
+    st.markdown("### 🧭 Cartes de contrôle")
+    carte_cote = cartes[cartes["Nom_Cote"] == nom_cote]
+    carte_cote = sous_echantillonner(carte_cote, "Date", "EWMA", garder=carte_cote["Alarme"])
+    fig_carte = make_subplots(rows=2, cols=1, shared_xaxes=True,
+                              subplot_titles=("EWMA", "CUSUM tabulaire (σ)"))
+    fig_carte.add_trace(go.Scatter(x=carte_cote["Date"], y=carte_cote["EWMA"], mode="lines+markers", name="EWMA"), row=1, col=1)
+    fig_carte.add_trace(go.Scatter(x=carte_cote["Date"], y=carte_cote["EWMA LCS"], mode="lines", name="LCS",
+                                   line=dict(color="red", dash="dot")), row=1, col=1)
+    fig_carte.add_trace(go.Scatter(x=carte_cote["Date"], y=carte_cote["EWMA LCI"], mode="lines", name="LCI",
+                                   line=dict(color="red", dash="dot")), row=1, col=1)
+    alarmes = carte_cote[carte_cote["Alarme"]]
+    fig_carte.add_trace(go.Scatter(x=alarmes["Date"], y=alarmes["EWMA"], mode="markers", name="Alarme",
+                                   marker=dict(color="red", size=10, symbol="x")), row=1, col=1)
+    fig_carte.add_trace(go.Scatter(x=carte_cote["Date"], y=carte_cote["CUSUM +"], mode="lines", name="CUSUM +"), row=2, col=1)
+    fig_carte.add_trace(go.Scatter(x=carte_cote["Date"], y=-carte_cote["CUSUM -"], mode="lines", name="CUSUM -"), row=2, col=1)
+    fig_carte.add_hline(y=h_cusum, line_color="red", line_dash="dot", row=2, col=1)
+    fig_carte.add_hline(y=-h_cusum, line_color="red", line_dash="dot", row=2, col=1)
+    fig_carte.update_layout(height=600)
+    st.plotly_chart(fig_carte, use_container_width=True)
+
+    xbar = limites_xbar(fenetre(index, nom_cote))
+    xbar["OF"] = xbar["OF"].astype(str)
+    fig_xbar = make_subplots(rows=2, cols=1, shared_xaxes=True, subplot_titles=("X̄ par OF", "R par OF"))
+    fig_xbar.add_trace(go.Scatter(x=xbar["OF"], y=xbar["Xbar"], mode="lines+markers", name="X̄"), row=1, col=1)
+    for col in ["LCI X̄", "LCS X̄"]:
+        fig_xbar.add_trace(go.Scatter(x=xbar["OF"], y=xbar[col], mode="lines", name=col,
+                                      line=dict(color="red", dash="dot")), row=1, col=1)
+    fig_xbar.add_trace(go.Scatter(x=xbar["OF"], y=xbar["R"], mode="lines+markers", name="R"), row=2, col=1)
+    fig_xbar.add_trace(go.Scatter(x=xbar["OF"], y=xbar["LCS R"], mode="lines", name="LCS R",
+                                  line=dict(color="red", dash="dot")), row=2, col=1)
+    fig_xbar.update_layout(height=500)
+    st.plotly_chart(fig_xbar, use_container_width=True)
+
     st.markdown("### 📦 Distribution par OF")
     fig_box = px.box(df_cote, x="OF", y="Mesure", points="all", color="Hors_Tolérance",
                      color_discrete_map={False: "blue", True: "red"},
                      title=f"Distribution par OF pour '{nom_cote}'")
     st.plotly_chart(fig_box, use_container_width=True)
+
+    # --- SUIVI INCRÉMENTAL : moyenne ± σ par OF, mis à jour à chaque lot ---
+    st.markdown("### 🔁 Dérive des moyennes par OF (suivi incrémental)")
+    if st.button("➕ Ajouter ce lot au suivi"):
+        if not integrer_lot_session(df):
+            st.info("ℹ️ Ce lot est déjà intégré.")
+
+    acc = st.session_state.get("accumulateurs_spc")
+    if acc is not None and not acc.empty and nom_cote in acc.index.get_level_values("Nom_Cote"):
+        df_of = resumer_accumulateurs(acc.xs(nom_cote, level="Nom_Cote", drop_level=False))
+        df_of["OF"] = df_of["OF"].astype(str)
+        fig_of = px.line(df_of, x="OF", y="Moyenne", error_y="Écart-type", markers=True,
+                         title=f"Moyenne par OF pour '{nom_cote}' (tous lots intégrés)")
+        fig_of.add_hline(y=df_cote["Tolérance_Min"].iloc[0], line_color="red", line_dash="dot", annotation_text="Tol. Min")
+        fig_of.add_hline(y=df_cote["Tolérance_Max"].iloc[0], line_color="red", line_dash="dot", annotation_text="Tol. Max")
+        st.plotly_chart(fig_of, use_container_width=True)
+    else:
+        st.info("ℹ️ Aucun lot intégré au suivi pour cette cote.")
@@ -8,29 +8,10 @@ import plotly.graph_objects as go
 from modules.analyse_hauteurs import analyser_hauteurs
 from modules.analyse_rayons import analyser_rayons
 from modules.analyse_epaisseurs import analyser_epaisseurs
-from modules.data_cleaning import nettoyer_donnees_brutes
+from modules.data_cleaning import nettoyer_donnees_brutes, nettoyer_fichier_excel
+from modules.types_cotes import detecter_type, TYPES_COTES
 
-# --- Détection automatique du type de cote ---
-def detect_type(nom):
-    nom = nom.lower()
-    if "rayon" in nom:
-        return "Rayon"
-    elif "diam" in nom or "ø" in nom:
-        return "Diamètre extérieur"
-    elif "épais" in nom or "patin" in nom:
-        return "Épaisseur"
-    elif "largeur" in nom or "hauteur" in nom or "gorge" in nom:
-        return "Longueur"
-    elif "perçage" in nom:
-        return "Diamètre extérieur"
-    elif "alésage" in nom:
-        return "Alésage"
-    elif "angle" in nom:
-        return "Angle"
-    else:
-        return "Autre"
-
-types_possibles = ["Diamètre extérieur", "Alésage", "Épaisseur", "Rayon", "Longueur", "Angle", "Autre"]
+types_possibles = TYPES_COTES
 
 st.title("📏 Étude dimensionnelle - Développement")
 
@@ -52,11 +33,15 @@ if fichier_json is not None:
 # --- Données CSV collées ---
 st.markdown("### 📋 Coller les données CSV (copiées depuis Excel)")
 text_input = st.text_area("Zone de saisie CSV", height=200)
+fichier_excel = st.file_uploader("📂 ... ou importez l'export Excel brut (.xlsx)", type="xlsx")
 
 df = None
-if text_input.strip():
+if fichier_excel is not None or text_input.strip():
     try:
-        df = nettoyer_donnees_brutes(text_input)
+        if fichier_excel is not None:
+            df = nettoyer_fichier_excel(fichier_excel)
+        else:
+            df = nettoyer_donnees_brutes(text_input)
         st.success("✅ Données chargées avec succès")
 
         # Initialisation des cotes si absentes
@@ -64,7 +49,7 @@ if text_input.strip():
             unique_cotes = df["Nom_Cote"].dropna().unique().tolist()
             st.session_state.cotes_info = {
                 cote: {
-                    "Type_Cote": detect_type(cote),
+                    "Type_Cote": detecter_type(cote),
                     "Tolérances_GPS": [],
                     "Groupe_Profil": None,
                     "Position_Angulaire": "Non spécifié",
@@ -73,14 +58,6 @@ if text_input.strip():
                 for cote in unique_cotes
             }
 
-        df["Type_Cote"] = df["Nom_Cote"].apply(detect_type)
-
-        # Injecter Angle_Degres à partir de cotes_info
-        if "cotes_info" in st.session_state:
-            df["Angle_Degres"] = df["Nom_Cote"].map(
-                lambda x: st.session_state.cotes_info.get(x, {}).get("Angle_Degres", None)
-            )
-
         # Sélection des OF
         st.subheader("🧾 Sélection des OF à analyser")
         of_disponibles = df["OF"].dropna().unique().tolist()
@@ -0,0 +1,89 @@
+# Benchmark : passage large -> long du format BRUT
+# Compare l'ancienne boucle iterrows() à format_brut_vers_long (vectorisé).
+#
+# Usage : python Data_cleaning/bench_format_long.py [n_pieces] [n_cotes]
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "App"))
+from modules.data_cleaning import (  # noqa: E402
+    format_brut_vers_long,
+    ROW_COTE_NAMES, ROW_MIN, ROW_AIM, ROW_MAX, ROW_DATA_START,
+    COLUMN_DATA_START, COLUMN_DATETIME, COLUMN_SERIAL, COLUMN_PLATCODE, COLUMN_OF,
+)
+
+
+def generer_brut(n_pieces, n_cotes):
+    # Tableau brut simulé avec la même disposition que l'export machine
+    rng = np.random.default_rng(0)
+    n_lignes = ROW_DATA_START + n_pieces
+    n_colonnes = COLUMN_DATA_START + n_cotes
+    raw = np.full((n_lignes, n_colonnes), "", dtype=object)
+
+    nominal = np.round(rng.uniform(10, 300, n_cotes), 3)
+    raw[ROW_COTE_NAMES, COLUMN_DATA_START:] = [f"Cote {i}" for i in range(n_cotes)]
+    raw[ROW_MIN, COLUMN_DATA_START:] = (nominal - 0.2).astype(str)
+    raw[ROW_AIM, COLUMN_DATA_START:] = nominal.astype(str)
+    raw[ROW_MAX, COLUMN_DATA_START:] = (nominal + 0.2).astype(str)
+
+    raw[ROW_DATA_START:, COLUMN_DATETIME] = "2025-05-10"
+    raw[ROW_DATA_START:, COLUMN_SERIAL] = [f"S{i:05d}" for i in range(n_pieces)]
+    raw[ROW_DATA_START:, COLUMN_PLATCODE] = "HH120"
+    raw[ROW_DATA_START:, COLUMN_OF] = (9000 + np.arange(n_pieces) // 50).astype(str)
+    mesures = nominal + rng.normal(0, 0.05, (n_pieces, n_cotes))
+    raw[ROW_DATA_START:, COLUMN_DATA_START:] = np.round(mesures, 3).astype(str)
+    return pd.DataFrame(raw)
+
+
+def boucle_historique(df_temp):
+    # Version d'origine (iterrows + un dict par mesure)
+    cote_names = df_temp.iloc[ROW_COTE_NAMES, COLUMN_DATA_START:].values
+    min_tol = df_temp.iloc[ROW_MIN, COLUMN_DATA_START:].values
+    aim_tol = df_temp.iloc[ROW_AIM, COLUMN_DATA_START:].values
+    max_tol = df_temp.iloc[ROW_MAX, COLUMN_DATA_START:].values
+
+    data_vals = df_temp.iloc[ROW_DATA_START:, COLUMN_DATA_START:]
+    data_vals.columns = cote_names
+
+    info_cols_sorted = df_temp.iloc[ROW_DATA_START:, [COLUMN_DATETIME, COLUMN_SERIAL, COLUMN_PLATCODE, COLUMN_OF]].rename(
+        columns={COLUMN_DATETIME: "datetime", COLUMN_SERIAL: "serial", COLUMN_PLATCODE: "plantcode", COLUMN_OF: "OF"}
+    )
+
+    records = []
+    for idx, row in data_vals.iterrows():
+        info = info_cols_sorted.iloc[idx - ROW_DATA_START]
+        for i, val in enumerate(row):
+            records.append({
+                "Date": info["datetime"],
+                "Serial": info["serial"],
+                "OF": info["OF"],
+                "Nom_Cote": cote_names[i],
+                "Mesure": val,
+                "Nominal": aim_tol[i],
+                "Tolérance_Min": min_tol[i],
+                "Tolérance_Max": max_tol[i]
+            })
+    return pd.DataFrame(records)
+
+
+if __name__ == "__main__":
+    n_pieces = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_cotes = int(sys.argv[2]) if len(sys.argv) > 2 else 150
+    df_raw = generer_brut(n_pieces, n_cotes)
+    print(f"Format BRUT : {n_pieces} pièces x {n_cotes} cotes = {n_pieces * n_cotes} mesures")
+
+    t0 = time.perf_counter()
+    df_boucle = boucle_historique(df_raw.copy())
+    t_boucle = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    df_vect = format_brut_vers_long(df_raw)
+    t_vect = time.perf_counter() - t0
+
+    pd.testing.assert_frame_equal(df_boucle, df_vect)
+    print(f"Boucle iterrows : {t_boucle:8.3f} s")
+    print(f"Vectorisé       : {t_vect:8.3f} s  (x{t_boucle / t_vect:.0f})")